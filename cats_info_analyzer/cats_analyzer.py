@@ -1,10 +1,33 @@
+import sys
+import argparse
 from typing import List, Dict
 
+from shared.profiling import add_profile_arguments, profile_session, span
+from shared.record_reader import BACKENDS, Field, RecordError, RecordSchema, read_records
+
 CatInfo = Dict[str, str]
 CatsInfoList = List[CatInfo]
 
+# Each line: id,name,age
+CATS_SCHEMA: RecordSchema = RecordSchema(
+    [
+        Field("id", non_empty=True, empty_message="Empty cat ID in line {number}: {line}"),
+        Field("name", non_empty=True, empty_message="Empty cat name in line {number}: {line}"),
+        Field(
+            "age", int,
+            non_empty=True,
+            non_negative=True,
+            keep_text=True,
+            empty_message="Empty age in line {number}: {line}",
+            invalid_message="Invalid age format (must be integer): {text}",
+            negative_message="Age cannot be negative: {text}"
+        ),
+    ],
+    format_message="Invalid line format (expected 3 fields): {line}"
+)
+
 
-def get_cats_info(path: str) -> CatsInfoList:
+def get_cats_info(path: str, backend: str = "stream") -> CatsInfoList:
     """
     Reads cat information from a text file and returns a list of dictionaries.
     
@@ -12,6 +35,7 @@ def get_cats_info(path: str) -> CatsInfoList:
     
     Args:
         path (str): Path to the text file containing cat data
+        backend (str): Record reader backend: "stream", "mmap" or "parallel"
         
     Returns:
         List[Dict[str, str]]: List of dictionaries with keys "id", "name", "age"
@@ -22,56 +46,13 @@ def get_cats_info(path: str) -> CatsInfoList:
         RuntimeError: For unexpected errors during processing
     """
     try:
-        with open(path, 'r', encoding='utf-8') as file:
-            lines: List[str] = file.readlines()
-        
-        # Filter out empty lines
-        lines = [line.strip() for line in lines if line.strip()]
-        
-        cats_list: CatsInfoList = []
-        
-        for line_number, line in enumerate(lines, 1):
-            try:
-                # Split by comma and validate format
-                parts: List[str] = line.split(',')
-                if len(parts) != 3:
-                    raise ValueError(f"Invalid line format (expected 3 fields): {line}")
-                
-                # Clean whitespace and assign variables
-                cat_id: str = parts[0].strip()
-                name: str = parts[1].strip()
-                age_str: str = parts[2].strip()
-                
-                # Validate fields are not empty
-                if not cat_id:
-                    raise ValueError(f"Empty cat ID in line {line_number}: {line}")
-                if not name:
-                    raise ValueError(f"Empty cat name in line {line_number}: {line}")
-                if not age_str:
-                    raise ValueError(f"Empty age in line {line_number}: {line}")
-                
-                # Validate age is numeric and non-negative
-                try:
-                    age_int: int = int(age_str)
-                except ValueError:
-                    raise ValueError(f"Invalid age format (must be integer): {age_str}")
-                
-                if age_int < 0:
-                    raise ValueError(f"Age cannot be negative: {age_str}")
-                
-                # Create and add cat dictionary
-                cat_info: CatInfo = {
-                    "id": cat_id,
-                    "name": name,
-                    "age": age_str
-                }
-                
-                cats_list.append(cat_info)
-                
-            except ValueError as e:
-                raise ValueError(f"Error processing line {line_number} '{line}': {str(e)}")
-        
-        return cats_list
+        try:
+            return [
+                {"id": cat_id, "name": name, "age": age}
+                for cat_id, name, age in read_records(path, CATS_SCHEMA, backend)
+            ]
+        except RecordError as e:
+            raise ValueError(f"Error processing line {e.number} '{e.line}': {e.message}")
         
     except FileNotFoundError:
         raise FileNotFoundError(f"File not found: {path}")
@@ -82,5 +63,37 @@ def get_cats_info(path: str) -> CatsInfoList:
             raise RuntimeError(f"Unexpected error processing file: {str(e)}")
 
 
-cats_info = get_cats_info("test_data/valid_cats.txt")
-print(cats_info) 
\ No newline at end of file
+def main() -> None:
+    """
+    Print the cats read from a cats file.
+    """
+    parser = argparse.ArgumentParser(description="Read cat information from a cats file")
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default="test_data/valid_cats.txt",
+        help="Cats file (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="stream",
+        help="Record reader backend (default: %(default)s)"
+    )
+    add_profile_arguments(parser)
+    options = parser.parse_args()
+    
+    with profile_session(options):
+        try:
+            with span("get_cats_info"):
+                cats_info: CatsInfoList = get_cats_info(options.path, options.backend)
+        except (FileNotFoundError, ValueError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        
+        with span("output"):
+            print(cats_info)
+
+
+if __name__ == "__main__":
+    main()
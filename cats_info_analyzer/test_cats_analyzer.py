@@ -2,7 +2,9 @@ import unittest
 import os
 import tempfile
 from typing import List, Dict
+from unittest import mock
 from cats_analyzer import get_cats_info, CatsInfoList
+from shared import record_reader
 
 
 class TestCatsAnalyzer(unittest.TestCase):
@@ -188,6 +190,59 @@ class TestCatsAnalyzer(unittest.TestCase):
         finally:
             os.unlink(temp_file_path)
     
+    def test_detected_encodings(self) -> None:
+        """Test files exported as UTF-8 with BOM and as cp1251 on every backend."""
+        lines: str = "id1,Мурзик,4\r\nid2,Барсик,2\r\n"
+        for data in (b"\xef\xbb\xbf" + lines.encode("utf-8"), lines.encode("cp1251")):
+            with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.txt') as temp_file:
+                temp_file.write(data)
+                temp_file_path: str = temp_file.name
+            
+            try:
+                for backend in ("stream", "mmap", "parallel"):
+                    cats_info: CatsInfoList = get_cats_info(temp_file_path, backend=backend)
+                    
+                    self.assertEqual(cats_info, [
+                        {"id": "id1", "name": "Мурзик", "age": "4"},
+                        {"id": "id2", "name": "Барсик", "age": "2"},
+                    ])
+                
+            finally:
+                os.unlink(temp_file_path)
+    
+    def test_reader_backends(self) -> None:
+        """Test that every record reader backend returns the same cats and errors."""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as temp_file:
+            for i in range(1000):
+                temp_file.write(f"id_{i},Cat_{i},{i % 20}\n\n")
+            temp_file.write("id_bad,Cat_bad,-1\n")
+            temp_file_path: str = temp_file.name
+        
+        try:
+            for backend in ("stream", "mmap", "parallel"):
+                # Small blocks split the file into several blocks and byte ranges
+                with mock.patch.object(record_reader, "BLOCK_BYTES", 1024), \
+                        self.assertRaises(ValueError) as context:
+                    get_cats_info(temp_file_path, backend=backend)
+                
+                # Blank lines are not counted, so the invalid line is line 1001
+                self.assertEqual(
+                    str(context.exception),
+                    "Error processing line 1001 'id_bad,Cat_bad,-1': Age cannot be negative: -1"
+                )
+            
+            file_path: str = os.path.join(self.test_data_dir, "valid_cats.txt")
+            expected: CatsInfoList = get_cats_info(file_path, backend="stream")
+            self.assertEqual(get_cats_info(file_path, backend="mmap"), expected)
+            self.assertEqual(get_cats_info(file_path, backend="parallel"), expected)
+            
+            # The default backend never starts a process pool
+            with mock.patch.object(record_reader, "ProcessPoolExecutor", side_effect=AssertionError):
+                self.assertEqual(get_cats_info(file_path), expected)
+            
+        finally:
+            os.unlink(temp_file_path)
+    
 
 
 
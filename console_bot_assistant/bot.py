@@ -11,10 +11,231 @@ Commands:
     change [name] [phone] - Change existing contact's phone number
     phone [name] - Show phone number for a contact
     all - Show all contacts
-    close/exit - Exit the bot
+    import [path] - Import contacts from a .csv or .bin file
+    export [path] - Export contacts to a .csv or .bin file
+    undo - Undo the last add/change/commit
+    redo - Redo the last undone operation
+    begin - Start a batch; add/change commands are queued until commit
+    commit - Apply all queued add/change commands at once
+    rollback - Discard all queued add/change commands
+    stats - Show command latency statistics (requires --stats)
+    close/exit - Exit the bot (commit or roll back an open batch first)
+
+Options:
+    --stats - Record per-command latency statistics
+    --stats-json [path] - Record statistics and write them as JSON on exit
+    --history-size [n] - Number of operations kept for undo (default: 100)
+    --profile - Print the time spent in each stage of command processing on exit
+    --profile-stats [path] - Also run under cProfile and write pstats data
+    --profile-collapsed [path] - Write stage timings as collapsed stacks for flame graphs
 """
 
-from typing import Dict, List, Tuple
+import argparse
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import deque
+from itertools import accumulate, islice
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from shared.profiling import add_profile_arguments, count, profile_session, span, timer
+
+
+# Number of CSV rows validated and merged per step during import
+CSV_CHUNK_ROWS: int = 65536
+
+# Buffer size used for contact file I/O
+IO_BUFFER_SIZE: int = 1 << 20
+
+# Commands recorded by name in latency statistics; anything else is
+# recorded as "invalid" so typos cannot grow the statistics table
+KNOWN_COMMANDS: Tuple[str, ...] = (
+    "hello", "add", "change", "phone", "all", "import", "export",
+    "undo", "redo", "begin", "commit", "rollback", "stats", "close", "exit"
+)
+
+# Stages of command processing measured by CommandStats
+STAGES: Tuple[str, ...] = ("total", "parse", "handler", "output")
+
+# Binary snapshot layout: magic, record count, then a table of
+# 2 * count uint32 byte lengths (name, phone, name, phone, ...)
+# followed by the concatenated UTF-8 payload.
+BINARY_MAGIC: bytes = b"CBK1"
+BINARY_HEADER = struct.Struct("<4sQ")
+
+# Default number of operations kept in the undo history
+HISTORY_SIZE: int = 100
+
+# Journal entry item: (name, previous phone or None if the contact was new, new phone)
+Change = Tuple[str, Optional[str], str]
+
+
+class ContactJournal:
+    """
+    Bounded undo/redo history of contact mutations with batch support.
+    
+    Every applied operation is stored as a list of changes holding the
+    previous phone numbers, so it can be reverted and reapplied. While a
+    batch is open, updates are staged and applied together on commit as
+    a single journal entry.
+    """
+    
+    def __init__(self, limit: int = HISTORY_SIZE) -> None:
+        self.undo_stack: Deque[List[Change]] = deque(maxlen=limit)
+        self.redo_stack: List[List[Change]] = []
+        self.batch: Optional[Dict[str, str]] = None
+    
+    @property
+    def in_batch(self) -> bool:
+        """bool: Whether a batch is currently open."""
+        return self.batch is not None
+    
+    def exists(self, contacts: Dict[str, str], name: str) -> bool:
+        """
+        Check whether a contact exists, including contacts staged in the open batch.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            name (str): Contact name
+            
+        Returns:
+            bool: True if the contact exists or is staged
+        """
+        return name in contacts or (self.batch is not None and name in self.batch)
+    
+    def set(self, contacts: Dict[str, str], name: str, phone: str) -> bool:
+        """
+        Set a phone number, staging it if a batch is open.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            name (str): Contact name
+            phone (str): New phone number
+            
+        Returns:
+            bool: True if the update was staged, False if it was applied
+        """
+        if self.batch is not None:
+            self.batch[name] = phone
+            return True
+        
+        self.apply(contacts, [(name, phone)])
+        return False
+    
+    def apply(self, contacts: Dict[str, str], updates: Iterable[Tuple[str, str]]) -> int:
+        """
+        Apply updates as one journal entry and clear the redo history.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            updates (Iterable[Tuple[str, str]]): Pairs of (name, phone)
+            
+        Returns:
+            int: Number of applied changes
+        """
+        changes: List[Change] = [(name, contacts.get(name), phone) for name, phone in updates]
+        if not changes:
+            return 0
+        
+        for name, _, phone in changes:
+            contacts[name] = phone
+        
+        self.undo_stack.append(changes)
+        self.redo_stack.clear()
+        return len(changes)
+    
+    def begin(self) -> bool:
+        """
+        Open a batch.
+        
+        Returns:
+            bool: False if a batch is already open
+        """
+        if self.batch is not None:
+            return False
+        self.batch = {}
+        return True
+    
+    def commit(self, contacts: Dict[str, str]) -> Optional[int]:
+        """
+        Apply all staged updates of the open batch at once.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            
+        Returns:
+            Optional[int]: Number of applied changes, None if no batch is open
+        """
+        if self.batch is None:
+            return None
+        staged: Dict[str, str] = self.batch
+        self.batch = None
+        return self.apply(contacts, staged.items())
+    
+    def rollback(self) -> Optional[int]:
+        """
+        Discard all staged updates of the open batch.
+        
+        Returns:
+            Optional[int]: Number of discarded changes, None if no batch is open
+        """
+        if self.batch is None:
+            return None
+        discarded: int = len(self.batch)
+        self.batch = None
+        return discarded
+    
+    def undo(self, contacts: Dict[str, str]) -> Optional[int]:
+        """
+        Revert the most recent journal entry.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            
+        Returns:
+            Optional[int]: Number of reverted changes, None if there is nothing to undo
+        """
+        if not self.undo_stack:
+            return None
+        
+        changes: List[Change] = self.undo_stack.pop()
+        for name, previous, _ in reversed(changes):
+            if previous is None:
+                del contacts[name]
+            else:
+                contacts[name] = previous
+        
+        self.redo_stack.append(changes)
+        return len(changes)
+    
+    def redo(self, contacts: Dict[str, str]) -> Optional[int]:
+        """
+        Reapply the most recently undone journal entry.
+        
+        Args:
+            contacts (Dict[str, str]): Dictionary of contacts
+            
+        Returns:
+            Optional[int]: Number of reapplied changes, None if there is nothing to redo
+        """
+        if not self.redo_stack:
+            return None
+        
+        changes: List[Change] = self.redo_stack.pop()
+        for name, _, phone in changes:
+            contacts[name] = phone
+        
+        self.undo_stack.append(changes)
+        return len(changes)
+    
+    def clear(self) -> None:
+        """Forget the undo and redo history."""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
 
 
 def parse_input(user_input: str) -> Tuple[str, List[str]]:
@@ -32,13 +253,18 @@ def parse_input(user_input: str) -> Tuple[str, List[str]]:
     return cmd, args
 
 
-def add_contact(args: List[str], contacts: Dict[str, str]) -> str:
+def add_contact(
+    args: List[str],
+    contacts: Dict[str, str],
+    journal: Optional[ContactJournal] = None
+) -> str:
     """
     Add a new contact to the contacts dictionary.
     
     Args:
         args (List[str]): List containing [name, phone]
         contacts (Dict[str, str]): Dictionary of contacts
+        journal (Optional[ContactJournal]): Journal recording the change for undo
         
     Returns:
         str: Success message or error message
@@ -47,17 +273,28 @@ def add_contact(args: List[str], contacts: Dict[str, str]) -> str:
         return "Error: Please provide both name and phone number."
     
     name, phone = args
+    
+    if journal is not None:
+        if journal.set(contacts, name, phone):
+            return "Contact queued."
+        return "Contact added."
+    
     contacts[name] = phone
     return "Contact added."
 
 
-def change_contact(args: List[str], contacts: Dict[str, str]) -> str:
+def change_contact(
+    args: List[str],
+    contacts: Dict[str, str],
+    journal: Optional[ContactJournal] = None
+) -> str:
     """
     Change phone number for existing contact.
     
     Args:
         args (List[str]): List containing [name, new_phone]
         contacts (Dict[str, str]): Dictionary of contacts
+        journal (Optional[ContactJournal]): Journal recording the change for undo
         
     Returns:
         str: Success message or error message
@@ -67,6 +304,13 @@ def change_contact(args: List[str], contacts: Dict[str, str]) -> str:
     
     name, phone = args
     
+    if journal is not None:
+        if not journal.exists(contacts, name):
+            return "Error: Contact not found."
+        if journal.set(contacts, name, phone):
+            return "Contact queued."
+        return "Contact updated."
+    
     if name not in contacts:
         return "Error: Contact not found."
     
@@ -116,39 +360,726 @@ def show_all(contacts: Dict[str, str]) -> str:
     return "\n".join(result)
 
 
-def main() -> None:
+def _contact_file_format(path: str) -> str:
+    """
+    Determine contact file format from the file extension.
+    
+    Args:
+        path (str): Path to the contacts file
+        
+    Returns:
+        str: "csv", "bin" or an empty string for unsupported formats
     """
-    Main function that manages the command processing loop.
+    suffix: str = os.path.splitext(path)[1].lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix == ".bin":
+        return "bin"
+    return ""
+
+
+def _read_csv_contacts(path: str) -> Dict[str, str]:
     """
-    contacts: Dict[str, str] = {}
-    print("Welcome to the assistant bot!")
+    Read contacts from a CSV file in large chunks.
     
-    while True:
-        user_input: str = input("Enter a command: ")
-        command, args = parse_input(user_input)
+    An optional "name,phone" header row is skipped and blank rows are ignored.
+    
+    Args:
+        path (str): Path to the CSV file
         
-        if command in ["close", "exit"]:
-            print("Good bye!")
-            break
+    Returns:
+        Dict[str, str]: Contacts read from the file
         
-        elif command == "hello":
-            print("How can I help you?")
+    Raises:
+        ValueError: If a row does not contain exactly a name and a phone
+    """
+    staged: Dict[str, str] = {}
+    
+    with open(path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER_SIZE) as file:
+        reader = csv.reader(file)
+        rows_read: int = 0
         
-        elif command == "add":
-            print(add_contact(args, contacts))
+        while True:
+            with span("read"):
+                chunk: List[List[str]] = list(islice(reader, CSV_CHUNK_ROWS))
+            if not chunk:
+                break
+            
+            chunk_start: int = rows_read + 1
+            if rows_read == 0 and [field.strip().lower() for field in chunk[0]] == ["name", "phone"]:
+                chunk[0] = []
+            rows_read += len(chunk)
+            
+            # Blank rows come back as empty lists and are skipped
+            with span("validate"):
+                if any(len(row) != 2 for row in chunk):
+                    for offset, row in enumerate(chunk):
+                        if row and len(row) != 2:
+                            raise ValueError(f"Invalid CSV row {chunk_start + offset}: expected name and phone")
+                    chunk = [row for row in chunk if row]
+                
+                staged.update(chunk)
+    
+    return staged
+
+
+def _write_csv_contacts(path: str, contacts: Dict[str, str]) -> None:
+    """
+    Write contacts to a CSV file with a "name,phone" header.
+    
+    Args:
+        path (str): Path to the CSV file
+        contacts (Dict[str, str]): Dictionary of contacts
+    """
+    with open(path, "w", encoding="utf-8", newline="", buffering=IO_BUFFER_SIZE) as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "phone"])
+        items = iter(contacts.items())
+        while True:
+            chunk = list(islice(items, CSV_CHUNK_ROWS))
+            if not chunk:
+                break
+            writer.writerows(chunk)
+
+
+def _read_binary_contacts(path: str) -> Dict[str, str]:
+    """
+    Load contacts from a binary snapshot with a single mmap.
+    
+    The length table is read in one step and the payload is sliced with
+    precomputed offsets, so no per-record header parsing is needed.
+    
+    Args:
+        path (str): Path to the binary snapshot
         
-        elif command == "change":
-            print(change_contact(args, contacts))
+    Returns:
+        Dict[str, str]: Contacts read from the snapshot
         
-        elif command == "phone":
-            print(show_phone(args, contacts))
+    Raises:
+        ValueError: If the file is not a valid contacts snapshot
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < BINARY_HEADER.size:
+            raise ValueError("Invalid contacts snapshot")
         
-        elif command == "all":
-            print(show_all(contacts))
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, count = BINARY_HEADER.unpack_from(mapped, 0)
+            if magic != BINARY_MAGIC:
+                raise ValueError("Invalid contacts snapshot")
+            
+            table_start: int = BINARY_HEADER.size
+            payload_start: int = table_start + 8 * count
+            if payload_start > len(mapped):
+                raise ValueError("Truncated contacts snapshot")
+            
+            lengths = array("I")
+            lengths.frombytes(mapped[table_start:payload_start])
+            if sys.byteorder != "little":
+                lengths.byteswap()
+            
+            payload: bytes = mapped[payload_start:]
+    
+    offsets: List[int] = list(accumulate(lengths, initial=0))
+    if offsets[-1] != len(payload):
+        raise ValueError("Truncated contacts snapshot")
+    
+    if payload.isascii():
+        text: str = payload.decode("ascii")
+        fields: List[str] = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    else:
+        fields = [payload[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+    
+    return dict(zip(fields[0::2], fields[1::2]))
+
+
+def _write_binary_contacts(path: str, contacts: Dict[str, str]) -> None:
+    """
+    Write contacts as a binary snapshot.
+    
+    Args:
+        path (str): Path to the binary snapshot
+        contacts (Dict[str, str]): Dictionary of contacts
+    """
+    fields: List[bytes] = []
+    for name, phone in contacts.items():
+        fields.append(name.encode("utf-8"))
+        fields.append(phone.encode("utf-8"))
+    
+    lengths = array("I", map(len, fields))
+    if sys.byteorder != "little":
+        lengths.byteswap()
+    
+    with open(path, "wb", buffering=IO_BUFFER_SIZE) as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, len(contacts)))
+        file.write(lengths.tobytes())
+        file.write(b"".join(fields))
+
+
+def import_contacts(
+    args: List[str],
+    contacts: Dict[str, str],
+    journal: Optional[ContactJournal] = None
+) -> str:
+    """
+    Import contacts from a CSV file or a binary snapshot.
+    
+    Imported contacts are merged into the contacts dictionary, replacing
+    existing phone numbers. Nothing is merged if the file is invalid.
+    Imports are not journaled, so a successful import clears the undo history.
+    
+    Args:
+        args (List[str]): List containing [path]
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (Optional[ContactJournal]): Journal whose history is cleared on import
         
+    Returns:
+        str: Success message or error message
+    """
+    if len(args) != 1:
+        return "Error: Please provide a file path."
+    
+    if journal is not None and journal.in_batch:
+        return "Error: Commit or roll back the current batch before importing."
+    
+    path: str = args[0]
+    file_format: str = _contact_file_format(path)
+    
+    if not file_format:
+        return "Error: Unsupported file format (use .csv or .bin)."
+    
+    try:
+        if file_format == "csv":
+            imported: Dict[str, str] = _read_csv_contacts(path)
         else:
-            print("Invalid command.")
+            with span("read"):
+                imported = _read_binary_contacts(path)
+    except FileNotFoundError:
+        return f"Error: File not found: {path}"
+    except (OSError, UnicodeDecodeError, ValueError, csv.Error) as e:
+        return f"Error: Could not import contacts: {e}"
+    
+    count("contacts imported", len(imported))
+    with span("merge"):
+        contacts.update(imported)
+    if journal is not None:
+        journal.clear()
+    return f"Imported {len(imported)} contacts."
+
+
+def export_contacts(args: List[str], contacts: Dict[str, str]) -> str:
+    """
+    Export all contacts to a CSV file or a binary snapshot.
+    
+    The file is written next to the target and then moved into place,
+    so an interrupted export never leaves a partial file behind.
+    
+    Args:
+        args (List[str]): List containing [path]
+        contacts (Dict[str, str]): Dictionary of contacts
+        
+    Returns:
+        str: Success message or error message
+    """
+    if len(args) != 1:
+        return "Error: Please provide a file path."
+    
+    path: str = args[0]
+    file_format: str = _contact_file_format(path)
+    
+    if not file_format:
+        return "Error: Unsupported file format (use .csv or .bin)."
+    
+    temp_path: str = f"{path}.tmp"
+    try:
+        with span("write"):
+            if file_format == "csv":
+                _write_csv_contacts(temp_path, contacts)
+            else:
+                _write_binary_contacts(temp_path, contacts)
+            os.replace(temp_path, path)
+    except OSError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return f"Error: Could not export contacts: {e}"
+    
+    count("contacts exported", len(contacts))
+    return f"Exported {len(contacts)} contacts."
+
+
+def begin_batch(journal: ContactJournal) -> str:
+    """
+    Start a batch of add/change commands.
+    
+    Args:
+        journal (ContactJournal): Journal holding the batch
+        
+    Returns:
+        str: Success message or error message
+    """
+    if not journal.begin():
+        return "Error: A batch is already in progress."
+    return "Batch started."
+
+
+def commit_batch(contacts: Dict[str, str], journal: ContactJournal) -> str:
+    """
+    Apply all queued add/change commands at once.
+    
+    Args:
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (ContactJournal): Journal holding the batch
+        
+    Returns:
+        str: Success message or error message
+    """
+    applied: Optional[int] = journal.commit(contacts)
+    if applied is None:
+        return "Error: No batch in progress."
+    return f"Batch committed: {applied} changes."
+
+
+def rollback_batch(journal: ContactJournal) -> str:
+    """
+    Discard all queued add/change commands.
+    
+    Args:
+        journal (ContactJournal): Journal holding the batch
+        
+    Returns:
+        str: Success message or error message
+    """
+    discarded: Optional[int] = journal.rollback()
+    if discarded is None:
+        return "Error: No batch in progress."
+    return f"Batch discarded: {discarded} changes."
+
+
+def undo_change(contacts: Dict[str, str], journal: ContactJournal) -> str:
+    """
+    Undo the most recent add, change or committed batch.
+    
+    Args:
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (ContactJournal): Journal with the operation history
+        
+    Returns:
+        str: Success message or error message
+    """
+    if journal.in_batch:
+        return "Error: Commit or roll back the current batch first."
+    
+    reverted: Optional[int] = journal.undo(contacts)
+    if reverted is None:
+        return "Error: Nothing to undo."
+    return f"Undone: {reverted} changes."
+
+
+def redo_change(contacts: Dict[str, str], journal: ContactJournal) -> str:
+    """
+    Redo the most recently undone operation.
+    
+    Args:
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (ContactJournal): Journal with the operation history
+        
+    Returns:
+        str: Success message or error message
+    """
+    if journal.in_batch:
+        return "Error: Commit or roll back the current batch first."
+    
+    reapplied: Optional[int] = journal.redo(contacts)
+    if reapplied is None:
+        return "Error: Nothing to redo."
+    return f"Redone: {reapplied} changes."
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram in the spirit of HdrHistogram.
+    
+    Values below 16 ns are stored exactly; larger values are split into
+    8 linear sub-buckets per power of two, so any reported percentile is
+    within 12.5% of the recorded value.
+    """
+    
+    SUB_BUCKET_BITS: int = 3
+    
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count: int = 0
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+    
+    @classmethod
+    def bucket_index(cls, value_ns: int) -> int:
+        """
+        Map a latency to its bucket index.
+        
+        Args:
+            value_ns (int): Latency in nanoseconds
+            
+        Returns:
+            int: Bucket index, monotonic in the latency
+        """
+        shift: int = value_ns.bit_length() - cls.SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return value_ns
+        return (shift << cls.SUB_BUCKET_BITS) + (value_ns >> shift)
+    
+    @classmethod
+    def bucket_upper_bound(cls, index: int) -> int:
+        """
+        Return the largest latency that falls into a bucket.
+        
+        Args:
+            index (int): Bucket index
+            
+        Returns:
+            int: Upper bound of the bucket in nanoseconds
+        """
+        shift: int = (index >> cls.SUB_BUCKET_BITS) - 1
+        if shift <= 0:
+            return index
+        mantissa: int = index - (shift << cls.SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) - 1
+    
+    def record(self, value_ns: int) -> None:
+        """
+        Record a single latency.
+        
+        Args:
+            value_ns (int): Latency in nanoseconds
+        """
+        index: int = self.bucket_index(value_ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ns += value_ns
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+    
+    def percentile(self, percent: float) -> int:
+        """
+        Estimate a latency percentile.
+        
+        Args:
+            percent (float): Percentile between 0 and 100
+            
+        Returns:
+            int: Upper bound of the bucket holding the percentile, in nanoseconds
+        """
+        if not self.count:
+            return 0
+        
+        threshold: float = self.count * percent / 100
+        seen: int = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= threshold:
+                return min(self.bucket_upper_bound(index), self.max_ns)
+        return self.max_ns
+    
+    def to_dict(self) -> Dict[str, int]:
+        """
+        Summarize the histogram for JSON output.
+        
+        Returns:
+            Dict[str, int]: Count, total, mean, max and p50/p90/p99 latencies
+        """
+        return {
+            "count": self.count,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns // self.count if self.count else 0,
+            "max_ns": self.max_ns,
+            "p50_ns": self.percentile(50),
+            "p90_ns": self.percentile(90),
+            "p99_ns": self.percentile(99),
+        }
+
+
+class CommandStats:
+    """
+    Per-command call counts and latency histograms for each processing stage.
+    """
+    
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+    
+    def record(self, command: str, parse_ns: int, handler_ns: int, output_ns: int) -> None:
+        """
+        Record the stage timings of one processed command.
+        
+        Args:
+            command (str): Parsed command name
+            parse_ns (int): Time spent parsing the input
+            handler_ns (int): Time spent in the command handler
+            output_ns (int): Time spent printing the response
+        """
+        name: str = command if command in KNOWN_COMMANDS else "invalid"
+        histograms: Optional[Dict[str, LatencyHistogram]] = self.histograms.get(name)
+        if histograms is None:
+            histograms = {stage: LatencyHistogram() for stage in STAGES}
+            self.histograms[name] = histograms
+        
+        histograms["parse"].record(parse_ns)
+        histograms["handler"].record(handler_ns)
+        histograms["output"].record(output_ns)
+        histograms["total"].record(parse_ns + handler_ns + output_ns)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summarize all recorded statistics for JSON output.
+        
+        Returns:
+            Dict[str, Any]: Statistics keyed by command and stage
+        """
+        return {
+            "commands": {
+                name: {
+                    "calls": histograms["total"].count,
+                    "stages": {stage: histogram.to_dict() for stage, histogram in histograms.items()},
+                }
+                for name, histograms in self.histograms.items()
+            }
+        }
+
+
+def format_duration(value_ns: int) -> str:
+    """
+    Format a duration in nanoseconds with a readable unit.
+    
+    Args:
+        value_ns (int): Duration in nanoseconds
+        
+    Returns:
+        str: Formatted duration, e.g. "850 ns" or "12.3 us"
+    """
+    if value_ns < 1_000:
+        return f"{value_ns} ns"
+    if value_ns < 1_000_000:
+        return f"{value_ns / 1_000:.1f} us"
+    if value_ns < 1_000_000_000:
+        return f"{value_ns / 1_000_000:.2f} ms"
+    return f"{value_ns / 1_000_000_000:.2f} s"
+
+
+def show_stats(stats: Optional[CommandStats]) -> str:
+    """
+    Show call counts and p50/p99 latencies per command.
+    
+    Args:
+        stats (Optional[CommandStats]): Recorded statistics, None if disabled
+        
+    Returns:
+        str: Statistics table or error message
+    """
+    if stats is None:
+        return "Error: Statistics are disabled (start the bot with --stats)."
+    
+    if not stats.histograms:
+        return "No statistics recorded yet."
+    
+    result: List[str] = [f"{'command':<10}{'calls':>7}  {'stage':<8}{'p50':>12}{'p99':>12}"]
+    for name, histograms in sorted(stats.histograms.items()):
+        calls: int = histograms["total"].count
+        for stage in STAGES:
+            histogram: LatencyHistogram = histograms[stage]
+            label: str = f"{name:<10}{calls:>7}" if stage == "total" else " " * 17
+            result.append(
+                f"{label}  {stage:<8}"
+                f"{format_duration(histogram.percentile(50)):>12}"
+                f"{format_duration(histogram.percentile(99)):>12}"
+            )
+    
+    return "\n".join(result)
+
+
+def write_stats_json(path: str, stats: CommandStats) -> None:
+    """
+    Write recorded statistics to a JSON file.
+    
+    Args:
+        path (str): Path to the JSON file
+        stats (CommandStats): Recorded statistics
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(stats.to_dict(), file, indent=2)
+
+
+def non_negative_int(value: str) -> int:
+    """
+    Parse a command line count that may be zero.
+    
+    Args:
+        value (str): Option value
+        
+    Returns:
+        int: The parsed count
+        
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer of at least 0
+    """
+    try:
+        number: int = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {number}")
+    return number
+
+
+def setup_argument_parser() -> argparse.ArgumentParser:
+    """
+    Set up command line argument parser.
+    
+    Returns:
+        argparse.ArgumentParser: Configured argument parser
+    """
+    parser = argparse.ArgumentParser(description="Console bot that manages contacts")
+    
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Record per-command latency statistics"
+    )
+    
+    parser.add_argument(
+        "--stats-json",
+        metavar="PATH",
+        help="Record statistics and write them as JSON when the bot exits"
+    )
+    
+    parser.add_argument(
+        "--history-size",
+        type=non_negative_int,
+        default=HISTORY_SIZE,
+        metavar="N",
+        help=f"Number of operations kept for undo (default: {HISTORY_SIZE})"
+    )
+    
+    add_profile_arguments(parser)
+    
+    return parser
+
+
+def handle_command(
+    command: str,
+    args: List[str],
+    contacts: Dict[str, str],
+    journal: ContactJournal,
+    stats: Optional[CommandStats] = None
+) -> str:
+    """
+    Run the handler of a parsed command.
+    
+    Args:
+        command (str): Parsed command name
+        args (List[str]): Command arguments
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (ContactJournal): Journal for undo/redo and batches
+        stats (Optional[CommandStats]): Recorded statistics, None if disabled
+        
+    Returns:
+        str: Response to print
+    """
+    if command in ["close", "exit"]:
+        if journal.in_batch:
+            return "Error: Commit or roll back the current batch before exiting."
+        return "Good bye!"
+    
+    elif command == "hello":
+        return "How can I help you?"
+    
+    elif command == "add":
+        return add_contact(args, contacts, journal)
+    
+    elif command == "change":
+        return change_contact(args, contacts, journal)
+    
+    elif command == "phone":
+        return show_phone(args, contacts)
+    
+    elif command == "all":
+        return show_all(contacts)
+    
+    elif command == "import":
+        return import_contacts(args, contacts, journal)
+    
+    elif command == "export":
+        return export_contacts(args, contacts)
+    
+    elif command == "undo":
+        return undo_change(contacts, journal)
+    
+    elif command == "redo":
+        return redo_change(contacts, journal)
+    
+    elif command == "begin":
+        return begin_batch(journal)
+    
+    elif command == "commit":
+        return commit_batch(contacts, journal)
+    
+    elif command == "rollback":
+        return rollback_batch(journal)
+    
+    elif command == "stats":
+        return show_stats(stats)
+    
+    return "Invalid command."
+
+
+def run_bot(
+    contacts: Dict[str, str],
+    journal: ContactJournal,
+    stats: Optional[CommandStats] = None
+) -> None:
+    """
+    Run the command processing loop until the user exits.
+    
+    Args:
+        contacts (Dict[str, str]): Dictionary of contacts
+        journal (ContactJournal): Journal for undo/redo and batches
+        stats (Optional[CommandStats]): Statistics to record into, None to disable timing
+    """
+    # Statistics read the stage times off the spans, which then time even without profiling
+    stage = timer if stats is not None else span
+    while True:
+        user_input: str = input("Enter a command: ")
+        with stage("parse") as parsing:
+            command, args = parse_input(user_input)
+        
+        with stage("handler") as handling, span(command if command in KNOWN_COMMANDS else "invalid"):
+            response: str = handle_command(command, args, contacts, journal, stats)
+        
+        with stage("output") as output:
+            print(response)
+        if stats is not None:
+            stats.record(command, parsing.elapsed_ns, handling.elapsed_ns, output.elapsed_ns)
+        
+        if command in ["close", "exit"] and not journal.in_batch:
+            break
+
+
+def main() -> None:
+    """
+    Main function that sets up the bot and runs the command processing loop.
+    """
+    options = setup_argument_parser().parse_args()
+    stats: Optional[CommandStats] = None
+    if options.stats or options.stats_json:
+        stats = CommandStats()
+    
+    contacts: Dict[str, str] = {}
+    print("Welcome to the assistant bot!")
+    
+    try:
+        with profile_session(options):
+            run_bot(contacts, ContactJournal(options.history_size), stats)
+    finally:
+        if stats is not None and options.stats_json:
+            write_stats_json(options.stats_json, stats)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -5,7 +5,19 @@ Test script for Console Bot Assistant
 This script demonstrates the bot functionality by testing all commands.
 """
 
-from bot import parse_input, add_contact, change_contact, show_phone, show_all
+import io
+import os
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+from bot import (
+    parse_input, add_contact, change_contact, show_phone, show_all,
+    import_contacts, export_contacts, LatencyHistogram, CommandStats, show_stats,
+    ContactJournal, begin_batch, commit_batch, rollback_batch, undo_change, redo_change,
+    run_bot, setup_argument_parser
+)
+from shared import profiling
 
 
 def test_bot_functionality():
@@ -85,6 +97,237 @@ def test_bot_functionality():
     print("=== All tests completed successfully! ===")
 
 
+def test_import_export():
+    """Test CSV and binary round trips of the contact book."""
+    
+    print("=== Testing import/export ===\n")
+    
+    contacts = {"John": "1234567890", "Jane": "0987654321", "Олена": "+380501112233"}
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file_name in ("contacts.csv", "contacts.bin"):
+            path = os.path.join(temp_dir, file_name)
+            
+            result = export_contacts([path], contacts)
+            print(f"   export {file_name} -> {result}")
+            assert result == "Exported 3 contacts."
+            
+            loaded = {}
+            result = import_contacts([path], loaded)
+            print(f"   import {file_name} -> {result}")
+            assert result == "Imported 3 contacts."
+            assert loaded == contacts
+        
+        # CRM exports may come without a header and with blank rows
+        csv_path = os.path.join(temp_dir, "crm.csv")
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("Bob,111\n\nAlice,222\n")
+        loaded = {"Bob": "000"}
+        assert import_contacts([csv_path], loaded) == "Imported 2 contacts."
+        assert loaded == {"Bob": "111", "Alice": "222"}
+        
+        # Invalid rows abort the import without touching the contacts
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("name,phone\nBob,111\nAlice\n")
+        loaded = {}
+        result = import_contacts([csv_path], loaded)
+        print(f"   import invalid csv -> {result}")
+        assert result == "Error: Could not import contacts: Invalid CSV row 3: expected name and phone"
+        assert loaded == {}
+        
+        bin_path = os.path.join(temp_dir, "broken.bin")
+        with open(bin_path, "wb") as file:
+            file.write(b"not a snapshot")
+        assert import_contacts([bin_path], loaded).startswith("Error:")
+    
+    assert import_contacts(["missing.csv"], {}) == "Error: File not found: missing.csv"
+    assert import_contacts(["contacts.txt"], {}) == "Error: Unsupported file format (use .csv or .bin)."
+    assert export_contacts([], {}) == "Error: Please provide a file path."
+    print()
+
+
+def test_latency_stats():
+    """Test latency histograms and the stats command output."""
+    
+    print("=== Testing latency statistics ===\n")
+    
+    histogram = LatencyHistogram()
+    for value_ns in range(1, 1001):
+        histogram.record(value_ns * 1000)
+    
+    # Percentiles are bucket upper bounds, within 12.5% of the exact value
+    p50 = histogram.percentile(50)
+    p99 = histogram.percentile(99)
+    print(f"   p50={p50} p99={p99}")
+    assert 500_000 <= p50 <= 500_000 * 1.125
+    assert 990_000 <= p99 <= 990_000 * 1.125
+    assert histogram.percentile(100) == 1_000_000
+    
+    for value_ns in range(100_000):
+        index = LatencyHistogram.bucket_index(value_ns)
+        assert value_ns <= LatencyHistogram.bucket_upper_bound(index)
+        assert LatencyHistogram.bucket_index(LatencyHistogram.bucket_upper_bound(index)) == index
+    
+    assert show_stats(None).startswith("Error:")
+    
+    stats = CommandStats()
+    assert show_stats(stats) == "No statistics recorded yet."
+    stats.record("add", 100, 1000, 200)
+    stats.record("typo", 10, 10, 10)
+    summary = stats.to_dict()["commands"]
+    assert summary["add"]["calls"] == 1
+    assert summary["add"]["stages"]["handler"]["max_ns"] == 1000
+    assert summary["add"]["stages"]["total"]["max_ns"] == 1300
+    assert "invalid" in summary and "typo" not in summary
+    
+    result = show_stats(stats)
+    print(result)
+    assert "add" in result and "1.3 us" in result
+    print()
+
+
+def test_profiling():
+    """Test profiling spans and counters around the import stages."""
+    
+    print("=== Testing profiling ===\n")
+    
+    # Disabled hooks record nothing and wrap nothing
+    assert profiling.span("read") is profiling.NULL_SPAN
+    assert profiling.timed("read", len) is len
+    
+    # Timers measure either way and record a span only while profiling
+    with profiling.timer("read") as unrecorded:
+        sum(range(1000))
+    assert unrecorded.elapsed_ns > 0
+    
+    profiler = profiling.enable()
+    try:
+        with profiling.timer("read") as recorded:
+            sum(range(1000))
+        stats = CommandStats()
+        with mock.patch("builtins.input", side_effect=["hello", "close"]), redirect_stdout(io.StringIO()):
+            run_bot({}, ContactJournal(), stats)
+    finally:
+        profiling.disable()
+    assert profiler.spans[("read",)].total_ns == recorded.elapsed_ns
+    # The bot statistics come from the same spans as the profile
+    assert profiler.spans[("handler",)].calls == 2
+    assert sorted(stats.histograms) == ["close", "hello"]
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "contacts.csv")
+        export_contacts([path], {"John": "1234567890", "Jane": "0987654321"})
+        
+        profiler = profiling.enable()
+        try:
+            with profiling.span("import"):
+                assert import_contacts([path], {}) == "Imported 2 contacts."
+        finally:
+            assert profiling.disable() is profiler
+    
+    assert profiling.active() is None
+    # One chunk with the rows and one empty read at the end of the file
+    assert profiler.spans[("import", "read")].calls == 2
+    assert profiler.spans[("import", "validate")].calls == 1
+    assert profiler.spans[("import", "merge")].calls == 1
+    assert profiler.counters == {"contacts imported": 2}
+    
+    stats = profiler.spans[("import",)]
+    assert stats.child_ns == sum(
+        profiler.spans[("import", stage)].total_ns for stage in ("read", "validate", "merge")
+    )
+    
+    report = profiler.report()
+    print(report)
+    assert "\n  read " in report and "contacts imported" in report
+    for line in profiler.iter_collapsed():
+        stack, value = line.rsplit(" ", 1)
+        assert stack.startswith("import") and int(value) > 0
+    print()
+
+
+def test_undo_redo_and_batches():
+    """Test the operation journal, undo/redo and batch commits."""
+    
+    print("=== Testing undo/redo and batches ===\n")
+    
+    contacts = {}
+    journal = ContactJournal(limit=2)
+    
+    assert undo_change(contacts, journal) == "Error: Nothing to undo."
+    assert add_contact(["John", "111"], contacts, journal) == "Contact added."
+    assert change_contact(["John", "222"], contacts, journal) == "Contact updated."
+    assert change_contact(["Bob", "333"], contacts, journal) == "Error: Contact not found."
+    
+    assert undo_change(contacts, journal) == "Undone: 1 changes."
+    assert contacts == {"John": "111"}
+    assert undo_change(contacts, journal) == "Undone: 1 changes."
+    assert contacts == {}
+    assert redo_change(contacts, journal) == "Redone: 1 changes."
+    assert contacts == {"John": "111"}
+    
+    # A new change drops the redo history
+    assert add_contact(["Jane", "444"], contacts, journal) == "Contact added."
+    assert redo_change(contacts, journal) == "Error: Nothing to redo."
+    
+    # Queued commands are applied together and undone as one operation
+    assert begin_batch(journal) == "Batch started."
+    assert begin_batch(journal) == "Error: A batch is already in progress."
+    assert add_contact(["Bob", "555"], contacts, journal) == "Contact queued."
+    assert change_contact(["Bob", "666"], contacts, journal) == "Contact queued."
+    assert change_contact(["John", "777"], contacts, journal) == "Contact queued."
+    assert undo_change(contacts, journal) == "Error: Commit or roll back the current batch first."
+    assert contacts == {"John": "111", "Jane": "444"}
+    assert commit_batch(contacts, journal) == "Batch committed: 2 changes."
+    assert contacts == {"John": "777", "Jane": "444", "Bob": "666"}
+    print(f"   after commit -> {contacts}")
+    
+    assert undo_change(contacts, journal) == "Undone: 2 changes."
+    assert contacts == {"John": "111", "Jane": "444"}
+    
+    assert begin_batch(journal) == "Batch started."
+    assert add_contact(["Alice", "888"], contacts, journal) == "Contact queued."
+    assert rollback_batch(journal) == "Batch discarded: 1 changes."
+    assert commit_batch(contacts, journal) == "Error: No batch in progress."
+    assert contacts == {"John": "111", "Jane": "444"}
+    
+    # The history is bounded by the journal limit
+    assert undo_change(contacts, journal) == "Undone: 1 changes."
+    assert undo_change(contacts, journal) == "Error: Nothing to undo."
+    assert contacts == {"John": "111"}
+    print()
+
+
+def test_exit_and_history_size():
+    """Test that exit keeps an open batch and that the history size is validated."""
+    
+    print("=== Testing exit and --history-size ===\n")
+    
+    contacts = {}
+    commands = ["begin", "add Bob 555", "exit", "commit", "exit"]
+    output = io.StringIO()
+    with mock.patch("builtins.input", side_effect=commands), redirect_stdout(output):
+        run_bot(contacts, ContactJournal())
+    
+    lines = output.getvalue().splitlines()
+    print(f"   {lines}")
+    assert lines[2] == "Error: Commit or roll back the current batch before exiting."
+    assert lines[-1] == "Good bye!"
+    assert contacts == {"Bob": "555"}
+    
+    parser = setup_argument_parser()
+    assert parser.parse_args(["--history-size", "0"]).history_size == 0
+    for value in ("-1", "many"):
+        try:
+            with redirect_stderr(io.StringIO()):
+                parser.parse_args(["--history-size", value])
+        except SystemExit as error:
+            assert error.code == 2
+        else:
+            raise AssertionError(f"--history-size {value} was accepted")
+    print()
+
+
 def demonstrate_interactive_usage():
     """Show example of how the bot would work interactively."""
     
@@ -114,4 +357,9 @@ def demonstrate_interactive_usage():
 
 if __name__ == "__main__":
     test_bot_functionality()
+    test_import_export()
+    test_latency_stats()
+    test_profiling()
+    test_undo_redo_and_batches()
+    test_exit_and_history_size()
     demonstrate_interactive_usage() 
\ No newline at end of file
@@ -1,12 +1,28 @@
-from typing import Tuple, List, TextIO
+import sys
+import argparse
+from typing import Tuple
 
+from shared.profiling import add_profile_arguments, profile_session, span
+from shared.record_reader import BACKENDS, Field, RecordError, RecordSchema, read_records
 
-def total_salary(path: str) -> Tuple[float, float]:
+
+# Each line: name,salary
+SALARY_SCHEMA: RecordSchema = RecordSchema(
+    [
+        Field("name", non_empty=True, empty_message="Empty name in line: {line}"),
+        Field("salary", float, non_negative=True, negative_message="Negative salary not allowed: {value}"),
+    ],
+    format_message="Invalid line format: {line}"
+)
+
+
+def total_salary(path: str, backend: str = "stream") -> Tuple[float, float]:
     """
     Analyzes salary data from a text file and calculates total and average salary.
     
     Args:
         path (str): Path to the text file containing salary data
+        backend (str): Record reader backend: "stream", "mmap" or "parallel"
         
     Returns:
         Tuple[float, float]: A tuple containing (total_salary, average_salary)
@@ -17,50 +33,18 @@ def total_salary(path: str) -> Tuple[float, float]:
         RuntimeError: For unexpected errors during processing
     """
     try:
-        with open(path, 'r', encoding='utf-8') as file:
-            lines: List[str] = file.readlines()
-        
-        # Filter out empty lines
-        lines = [line.strip() for line in lines if line.strip()]
-        
-        if not lines:
-            raise ValueError("File is empty or contains no valid data")
-        
         total: float = 0.0
         count: int = 0
         
-        for line in lines:
-            try:
-                # Split by comma and validate format
-                parts: List[str] = line.split(',')
-                if len(parts) != 2:
-                    raise ValueError(f"Invalid line format: {line}")
-                
-                name: str
-                salary_str: str
-                name, salary_str = parts
-                name = name.strip()
-                salary_str = salary_str.strip()
-                
-                # Validate name is not empty
-                if not name:
-                    raise ValueError(f"Empty name in line: {line}")
-                
-                # Convert salary to float
-                salary: float = float(salary_str)
-                
-                # Validate salary is non-negative
-                if salary < 0:
-                    raise ValueError(f"Negative salary not allowed: {salary}")
-                
+        try:
+            for _, salary in read_records(path, SALARY_SCHEMA, backend):
                 total += salary
                 count += 1
-                
-            except ValueError as e:
-                raise ValueError(f"Error processing line '{line}': {str(e)}")
+        except RecordError as e:
+            raise ValueError(f"Error processing line '{e.line}': {e.message}")
         
         if count == 0:
-            raise ValueError("No valid salary records found")
+            raise ValueError("File is empty or contains no valid data")
         
         average: float = total / count
         return (total, average)
@@ -71,8 +55,40 @@ def total_salary(path: str) -> Tuple[float, float]:
         if isinstance(e, (ValueError, FileNotFoundError)):
             raise
         else:
-            raise RuntimeError(f"Unexpected error processing file: {str(e)}") 
+            raise RuntimeError(f"Unexpected error processing file: {str(e)}")
+
+
+def main() -> None:
+    """
+    Print the total and average salary from a salary file.
+    """
+    parser = argparse.ArgumentParser(description="Calculate the total and average salary from a salary file")
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default="test_data/valid_salaries.txt",
+        help="Salary file (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="stream",
+        help="Record reader backend (default: %(default)s)"
+    )
+    add_profile_arguments(parser)
+    options = parser.parse_args()
+    
+    with profile_session(options):
+        try:
+            with span("total_salary"):
+                total, average = total_salary(options.path, options.backend)
+        except (FileNotFoundError, ValueError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
         
+        with span("output"):
+            print(f"Загальна сума заробітної плати: {total}, Середня заробітна плата: {average}")
+
 
-total, average = total_salary("test_data/valid_salaries.txt")
-print(f"Загальна сума заробітної плати: {total}, Середня заробітна плата: {average}")        
\ No newline at end of file
+if __name__ == "__main__":
+    main()
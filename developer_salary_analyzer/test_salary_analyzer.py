@@ -156,6 +156,66 @@ class TestTotalSalary(unittest.TestCase):
         finally:
             os.unlink(temp_file_path)
 
+    
+    def test_detected_encodings(self):
+        """Test salary files in cp1251 and in UTF-16 with a BOM."""
+        lines = "Олександр,3000\nМарія,2000\n"
+        for data in (lines.encode("cp1251"), lines.encode("utf-16")):
+            with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.txt') as temp_file:
+                temp_file.write(data)
+                temp_file_path = temp_file.name
+            
+            try:
+                for backend in ("stream", "mmap", "parallel"):
+                    total, average = total_salary(temp_file_path, backend=backend)
+                    self.assertEqual(total, 5000)
+                    self.assertEqual(average, 2500)
+            
+            finally:
+                os.unlink(temp_file_path)
+    
+    def test_reader_backends(self):
+        """Test that every record reader backend gives the same totals and errors."""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as temp_file:
+            for i in range(1000):
+                temp_file.write(f"Developer {i},{i}\r\n")
+            temp_file_path = temp_file.name
+        
+        try:
+            for backend in ("stream", "mmap", "parallel"):
+                total, average = total_salary(temp_file_path, backend=backend)
+                self.assertEqual(total, 499500)
+                self.assertEqual(average, 499.5)
+            
+            with open(temp_file_path, 'a', encoding='utf-8') as temp_file:
+                temp_file.write("Developer X,-5\n")
+            
+            for backend in ("stream", "mmap", "parallel"):
+                with self.assertRaises(ValueError) as context:
+                    total_salary(temp_file_path, backend=backend)
+                
+                self.assertEqual(
+                    str(context.exception),
+                    "Error processing line 'Developer X,-5': Negative salary not allowed: -5.0"
+                )
+        
+        finally:
+            os.unlink(temp_file_path)
+    
+    def test_field_counts_that_even_out(self):
+        """Test that a line with an extra field is caught even if another line lacks one."""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as temp_file:
+            temp_file.write("Alice,100\nBob,200,300\nCarol\n")
+            temp_file_path = temp_file.name
+        
+        try:
+            with self.assertRaises(ValueError) as context:
+                total_salary(temp_file_path)
+            
+            self.assertEqual(str(context.exception), "Error processing line 'Bob,200,300': Invalid line format: Bob,200,300")
+        
+        finally:
+            os.unlink(temp_file_path)
 
 def run_all_tests():
     """Run all tests and display results."""
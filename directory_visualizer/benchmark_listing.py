@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Directory Listing Benchmark
+
+Compares the pathlib-based listing the visualizer used before with the
+os.scandir-based read_directory(). Both walk the same generated tree and
+perform the checks the renderer needs: sorting directories first and
+testing every entry with is_dir(). Stat calls made from Python are counted
+by wrapping os.stat; os.DirEntry answers from the cached file type of the
+directory listing and does not go through os.stat at all.
+
+Usage:
+    python benchmark_listing.py --files 1000000
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from directory_visualizer import read_directory
+
+
+def build_tree(root: Path, files: int, files_per_dir: int) -> None:
+    """
+    Create a tree of empty files spread over two levels of directories.
+
+    Args:
+        root (Path): Directory to create the tree in
+        files (int): Total number of files
+        files_per_dir (int): Number of files per leaf directory
+    """
+    dirs: int = max(1, files // files_per_dir)
+    for index in range(dirs):
+        leaf: Path = root / f"group{index % 100:02d}" / f"dir{index:06d}"
+        leaf.mkdir(parents=True, exist_ok=True)
+        for number in range(min(files_per_dir, files - index * files_per_dir)):
+            (leaf / f"file{number:05d}.txt").touch()
+
+
+def walk_pathlib(root: Path) -> int:
+    """
+    Walk the tree the way the pathlib-based renderer did.
+
+    Args:
+        root (Path): Root directory
+
+    Returns:
+        int: Number of visited entries
+    """
+    visited: int = 0
+    stack: List[Path] = [root]
+    while stack:
+        contents: List[Path] = [item for item in stack.pop().iterdir() if not item.name.startswith('.')]
+        contents.sort(key=lambda x: (x.is_file(), x.name.lower()))
+        for item in contents:
+            visited += 1
+            if item.is_dir():
+                stack.append(item)
+    return visited
+
+
+def walk_scandir(root: Path) -> int:
+    """
+    Walk the tree with read_directory().
+
+    Args:
+        root (Path): Root directory
+
+    Returns:
+        int: Number of visited entries
+    """
+    visited: int = 0
+    stack: List[str] = [str(root)]
+    while stack:
+        for entry in read_directory(stack.pop()):
+            visited += 1
+            if entry.is_dir():
+                stack.append(entry.path)
+    return visited
+
+
+def measure(walk: Callable[[Path], int], root: Path) -> Tuple[int, int, float]:
+    """
+    Run a walk while counting os.stat calls.
+
+    Args:
+        walk (Callable[[Path], int]): Walk function to measure
+        root (Path): Root directory
+
+    Returns:
+        Tuple[int, int, float]: (visited entries, os.stat calls, seconds)
+    """
+    original_stat = os.stat
+    calls: List[int] = [0]
+
+    def counting_stat(*args, **kwargs):
+        calls[0] += 1
+        return original_stat(*args, **kwargs)
+
+    os.stat = counting_stat
+    try:
+        started: float = time.perf_counter()
+        visited: int = walk(root)
+        elapsed: float = time.perf_counter() - started
+    finally:
+        os.stat = original_stat
+
+    return visited, calls[0], elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark directory listing strategies")
+    parser.add_argument("--files", type=int, default=100_000, help="Number of files in the generated tree")
+    parser.add_argument("--files-per-dir", type=int, default=1000, help="Number of files per leaf directory")
+    parser.add_argument("--root", type=str, default=None, help="Directory to build the tree in")
+    args = parser.parse_args()
+
+    root: Path = Path(tempfile.mkdtemp(prefix="dirvis-bench-", dir=args.root))
+    try:
+        print(f"Building tree with {args.files} files in {root} ...")
+        build_tree(root, args.files, args.files_per_dir)
+
+        for name, walk in (("pathlib", walk_pathlib), ("scandir", walk_scandir)):
+            visited, stat_calls, elapsed = measure(walk, root)
+            print(f"{name:<8} entries={visited:<9} stat calls={stat_calls:<9} time={elapsed:.3f}s")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
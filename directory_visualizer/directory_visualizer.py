@@ -9,21 +9,77 @@ Usage:
     python hw03.py /path/to/directory
 
 Requirements:
-    - colorama library for colored output
     - Python 3.6+
+    - colorama library for colored output on Windows consoles
 
 Author: DitriX
 """
 
+import os
+import re
 import sys
+import stat
+import json
 import argparse
+import fnmatch
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Union, Iterator
-from colorama import init, Fore, Back, Style
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, Set, TextIO, Tuple, Union
+)
 
+from shared.profiling import add_profile_arguments, profile_session, span, timed
+from ignore_rules import IgnoreRules
+from tree_model import (
+    DirectoryLister, InodeSet, TreeNode, build_tree, format_size, index_directories, link_target,
+    needs_listing, relative_path, trim_tree
+)
+from tree_snapshot import diff_trees, load_snapshot, save_snapshot
+from tree_watch import DirectoryWatcher, WatchedTree, create_watcher, wait_for_changes
+
+
+def non_negative_int(value: str) -> int:
+    """
+    Parse a command line count that may be zero.
+    
+    Args:
+        value (str): Option value
+        
+    Returns:
+        int: The parsed count
+        
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer of at least 0
+    """
+    try:
+        number: int = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {number}")
+    return number
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a command line count of at least one.
+    
+    Args:
+        value (str): Option value
+        
+    Returns:
+        int: The parsed count
+        
+    Raises:
+        argparse.ArgumentTypeError: If the value is not an integer of at least 1
+    """
+    number: int = non_negative_int(value)
+    if number == 0:
+        raise argparse.ArgumentTypeError("must be 1 or more, got 0")
+    return number
 
-# Initialize colorama for cross-platform colored output
-init(autoreset=True)
 
 def setup_argument_parser() -> argparse.ArgumentParser:
     """
@@ -43,6 +99,123 @@ def setup_argument_parser() -> argparse.ArgumentParser:
         help="Path to the directory to visualize"
     )
     
+    parser.add_argument(
+        "-w", "--workers",
+        type=positive_int,
+        default=1,
+        help="Number of threads listing directories ahead of rendering, "
+             "useful on high-latency storage such as NFS (default: 1)"
+    )
+    
+    parser.add_argument(
+        "-L", "--max-depth",
+        type=non_negative_int,
+        default=None,
+        help="Do not list directories deeper than this level (the root is level 0)"
+    )
+    
+    parser.add_argument(
+        "-n", "--max-entries-per-dir",
+        type=non_negative_int,
+        default=None,
+        help="Show at most this many entries per directory and collapse the rest"
+    )
+    
+    parser.add_argument(
+        "-I", "--include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Only show files matching the glob (repeatable); "
+             "globs containing '/' match the path relative to the root"
+    )
+    
+    parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Skip files and directories matching the glob (repeatable)"
+    )
+    
+    parser.add_argument(
+        "-g", "--gitignore",
+        action="store_true",
+        help="Skip entries ignored by .gitignore files inside the tree"
+    )
+    
+    parser.add_argument(
+        "-s", "--sizes",
+        action="store_true",
+        help="Show total size and file count of every directory; the whole tree is "
+             "scanned and --max-depth/--max-entries-per-dir only limit what is shown"
+    )
+    
+    parser.add_argument(
+        "-S", "--sort-size",
+        action="store_true",
+        help="Sort entries by size, largest first (implies --sizes)"
+    )
+    
+    parser.add_argument(
+        "-t", "--top",
+        type=non_negative_int,
+        default=None,
+        metavar="K",
+        help="Show only the K largest entries of every directory (implies --sort-size)"
+    )
+    
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        default=None,
+        help="Save the scanned tree to FILE and reuse it on the next run, "
+             "listing only directories whose modification time changed"
+    )
+    
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Show only the entries added or removed since the snapshot (requires --snapshot)"
+    )
+    
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and redraw the tree when the directory changes "
+             "(inotify on Linux, polling directory modification times elsewhere)"
+    )
+    
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, poll directory modification times even where inotify is available"
+    )
+    
+    parser.add_argument(
+        "-l", "--follow-symlinks",
+        action="store_true",
+        help="Descend into symlinked directories; every real directory is still shown only once"
+    )
+    
+    parser.add_argument(
+        "--color",
+        choices=("auto", "always", "never"),
+        default="auto",
+        help="Colour the tree: only when writing to a terminal (default), always or never"
+    )
+    
+    parser.add_argument(
+        "-f", "--format",
+        choices=OUTPUT_FORMATS,
+        default="tree",
+        help="Output format: coloured tree (default), plain relative paths, "
+             "a JSON array or one JSON object per line; all but tree stream "
+             "one record per entry without colours"
+    )
+    
+    add_profile_arguments(parser)
+    
     return parser
 
 
@@ -64,121 +237,1345 @@ def validate_directory_path(path_str: str) -> Path:
     try:
         path: Path = Path(path_str).resolve()
         
-        if not path.exists():
+        try:
+            mode: int = path.stat().st_mode
+        except FileNotFoundError:
             raise FileNotFoundError(f"Path does not exist: {path}")
         
-        if not path.is_dir():
+        if not stat.S_ISDIR(mode):
             raise NotADirectoryError(f"Path is not a directory: {path}")
         
-        # Test if we can access the directory
-        try:
-            list(path.iterdir())
-        except PermissionError:
-            raise PermissionError(f"Permission denied to access directory: {path}")
-        
         return path
         
     except OSError as e:
         raise OSError(f"Error accessing path '{path_str}': {e}")
 
 
-def get_directory_contents(directory: Path) -> List[Path]:
-    try:
-        contents: List[Path] = []
+
+class AnsiCodes:
+    """
+    Raw ANSI escape codes by name, replaced with empty strings when colours are off.
+    
+    Lines are built with the codes already in them and written straight to
+    the output stream, so no stream wrapper has to filter every write.
+    """
+    
+    def __init__(self, **codes: str) -> None:
+        self._codes: Dict[str, str] = codes
+        self.enable(True)
+    
+    def enable(self, enabled: bool) -> None:
+        """
+        Switch the codes on or off.
         
-        for item in directory.iterdir():
-            # Skip hidden files/directories
-            if item.name.startswith('.'):
+        Args:
+            enabled (bool): Whether the codes are emitted
+        """
+        for name, code in self._codes.items():
+            setattr(self, name, code if enabled else "")
+
+
+Fore = AnsiCodes(
+    RED="\x1b[31m", GREEN="\x1b[32m", YELLOW="\x1b[33m", BLUE="\x1b[34m", CYAN="\x1b[36m"
+)
+Style = AnsiCodes(BRIGHT="\x1b[1m", RESET_ALL="\x1b[0m")
+
+
+def setup_color(mode: str = "auto", stream: Optional[TextIO] = None) -> bool:
+    """
+    Decide whether output is coloured and prepare the console for it.
+    
+    colorama is only imported for coloured output on Windows, where it
+    enables ANSI processing in the console without wrapping the stream.
+    
+    Args:
+        mode (str): "auto" to colour only terminals, "always" or "never"
+        stream (Optional[TextIO]): Output stream, sys.stdout by default
+        
+    Returns:
+        bool: True if colours are enabled
+    """
+    output: TextIO = stream if stream is not None else sys.stdout
+    enabled: bool = mode == "always" or (mode == "auto" and output.isatty())
+    
+    if enabled and sys.platform == "win32":
+        try:
+            from colorama import just_fix_windows_console
+            just_fix_windows_console()
+        except ImportError:
+            enabled = mode == "always"
+    
+    Fore.enable(enabled)
+    Style.enable(enabled)
+    return enabled
+
+
+# Number of rendered lines collected before a single write to the output stream
+WRITE_BATCH_LINES: int = 4096
+
+# Prefetched listings allowed in flight per worker thread
+PREFETCH_PER_WORKER: int = 64
+
+# Escape sequence moving the cursor home and clearing the terminal before a redraw
+CLEAR_SCREEN: str = "\x1b[H\x1b[2J"
+
+# Values of --format; all but "tree" are machine-readable
+OUTPUT_FORMATS: Tuple[str, ...] = ("tree", "plain", "json", "ndjson")
+
+# Traversal event: (kind, depth, is_last, name, path) where kind is "dir",
+# "file", "link", "repeat" (a directory shown before), "more", "entry_error"
+# or "listing_error"; for "more" the path holds the number of omitted entries,
+# for "listing_error" the name holds the message
+TreeEvent = Tuple[str, int, bool, str, str]
+
+
+class MoreEntries:
+    """
+    Placeholder listed in place of the entries cut off by --max-entries-per-dir.
+    """
+    
+    def __init__(self, count: int) -> None:
+        self.count: int = count
+        self.name: str = f"… {count} more"
+        self.path: str = ""
+    
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return False
+    
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return False
+    
+    def is_symlink(self) -> bool:
+        return False
+
+
+class TreeFilter:
+    """
+    Traversal limits and filters applied while directories are listed.
+    
+    Everything is decided from the directory listing itself, so directories
+    that are excluded, ignored or deeper than the depth limit are never listed.
+    Listings may run on several threads; the only shared state is the cache
+    of parsed .gitignore files, which is written once per directory.
+    """
+    
+    def __init__(
+        self,
+        root: Union[Path, str],
+        max_depth: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        gitignore: bool = False
+    ) -> None:
+        self.root: str = os.fspath(root)
+        self.max_depth: Optional[int] = max_depth
+        self.max_entries: Optional[int] = max_entries
+        self.include: List[Tuple[bool, Pattern[str]]] = [self._compile(glob) for glob in include]
+        self.exclude: List[Tuple[bool, Pattern[str]]] = [self._compile(glob) for glob in exclude]
+        self.gitignore: bool = gitignore
+        # Only directories with their own .gitignore get an entry
+        self.ignore_rules: Dict[str, IgnoreRules] = {}
+    
+    @staticmethod
+    def _compile(glob: str) -> Tuple[bool, Pattern[str]]:
+        # Globs with a slash match the root-relative path, others the name
+        return "/" in glob, re.compile(fnmatch.translate(os.path.normcase(glob)))
+    
+    @staticmethod
+    def _matches(patterns: List[Tuple[bool, Pattern[str]]], name: str, relative: str) -> bool:
+        for uses_path, pattern in patterns:
+            if pattern.match(os.path.normcase(relative if uses_path else name)):
+                return True
+        return False
+    
+    def should_list(self, directory: str) -> bool:
+        """
+        Check the depth limit before a directory is listed.
+        
+        Args:
+            directory (str): Directory path inside the root
+            
+        Returns:
+            bool: False if the directory is too deep to be listed
+        """
+        if self.max_depth is None:
+            return True
+        depth: int = 0 if directory == self.root else relative_path(self.root, directory).count("/") + 1
+        return depth < self.max_depth
+    
+    def _rules_for(self, directory: str) -> Optional[IgnoreRules]:
+        # Nearest ancestor (or the directory itself) with a .gitignore file
+        while True:
+            rules: Optional[IgnoreRules] = self.ignore_rules.get(directory)
+            if rules is not None or len(directory) <= len(self.root):
+                return rules
+            directory = os.path.dirname(directory)
+    
+    def load_ignore_file(self, directory: str) -> None:
+        """
+        Read the .gitignore file of a directory that is not listed again.
+        
+        Listings reused from a snapshot never pass through select(), so their
+        rules are loaded here before the changed directories below them are listed.
+        
+        Args:
+            directory (str): Directory path inside the root
+        """
+        path: str = os.path.join(directory, ".gitignore")
+        if self.gitignore and os.path.isfile(path):
+            self.ignore_rules[directory] = IgnoreRules.from_file(path, self._rules_for(os.path.dirname(directory)))
+    
+    def select(self, directory: str, entries: Iterable[os.DirEntry]) -> List[os.DirEntry]:
+        """
+        Pick the visible entries of a directory listing that pass all filters.
+        
+        Args:
+            directory (str): Listed directory
+            entries (Iterable[os.DirEntry]): Raw directory listing
+            
+        Returns:
+            List[os.DirEntry]: Entries to show, unsorted
+        """
+        contents: List[os.DirEntry] = []
+        rules: Optional[IgnoreRules] = None
+        
+        for entry in entries:
+            if entry.name.startswith('.'):
+                if self.gitignore and entry.name == ".gitignore" and entry.is_file():
+                    rules = IgnoreRules.from_file(entry.path, self._rules_for(os.path.dirname(directory)))
+                    self.ignore_rules[directory] = rules
                 continue
-            contents.append(item)
+            contents.append(entry)
+        
+        if self.gitignore:
+            if rules is None:
+                rules = self._rules_for(directory)
+            if rules is not None:
+                contents = [entry for entry in contents if not rules.is_ignored(entry.path, entry.is_dir())]
+        
+        if self.exclude:
+            contents = [
+                entry for entry in contents
+                if not self._matches(self.exclude, entry.name, relative_path(self.root, entry.path))
+            ]
+        
+        if self.include:
+            contents = [
+                entry for entry in contents
+                if entry.is_dir() or self._matches(self.include, entry.name, relative_path(self.root, entry.path))
+            ]
+        
+        return contents
+    
+    def truncate(self, contents: List[os.DirEntry]) -> List[os.DirEntry]:
+        """
+        Collapse entries beyond the per-directory limit into a MoreEntries placeholder.
+        
+        Args:
+            contents (List[os.DirEntry]): Sorted entries
+            
+        Returns:
+            List[os.DirEntry]: At most max_entries entries plus the placeholder
+        """
+        if self.max_entries is None or len(contents) <= self.max_entries:
+            return contents
+        hidden: int = len(contents) - self.max_entries
+        return contents[:self.max_entries] + [MoreEntries(hidden)]
+    
+    @property
+    def active(self) -> bool:
+        """bool: Whether any limit or filter is configured."""
+        return (
+            self.max_depth is not None or self.max_entries is not None
+            or bool(self.include) or bool(self.exclude) or self.gitignore
+        )
+
+
+def read_directory(
+    directory: Union[Path, str],
+    tree_filter: Optional[TreeFilter] = None
+) -> List[os.DirEntry]:
+    """
+    List visible directory entries, directories first, then files, both alphabetically.
+    
+    Entries come from os.scandir, which caches the file type reported by the
+    directory listing itself, so sorting and the later is_dir() checks need
+    no extra stat calls except for symlinks.
+    
+    Args:
+        directory (Union[Path, str]): Directory to list
+        tree_filter (Optional[TreeFilter]): Limits and filters to apply while listing
+        
+    Returns:
+        List[os.DirEntry]: Sorted directory entries without hidden files/directories
         
-        # Sort: directories first, then files, both alphabetically
-        contents.sort(key=lambda x: (x.is_file(), x.name.lower()))
+    Raises:
+        PermissionError: If access is denied
+        OSError: If the directory cannot be read
+    """
+    if tree_filter is not None:
+        directory = os.fspath(directory)
+        if not tree_filter.should_list(directory):
+            return []
+    
+    with os.scandir(directory) as entries:
+        if tree_filter is not None:
+            contents: List[os.DirEntry] = tree_filter.select(directory, entries)
+        else:
+            # Skip hidden files/directories
+            contents = [entry for entry in entries if not entry.name.startswith('.')]
+    
+    # Sort: directories first, then files, both alphabetically
+    contents.sort(key=lambda x: (x.is_file(), x.name.lower()))
+    
+    if tree_filter is not None:
+        contents = tree_filter.truncate(contents)
+    
+    return contents
+
+
+def list_root_directory(
+    directory: Path,
+    tree_filter: Optional[TreeFilter] = None
+) -> List[os.DirEntry]:
+    """
+    List the root directory once up front, checking that it can be read.
+    
+    The listing is handed to the traversal, so the root is not listed twice.
+    
+    Args:
+        directory (Path): Validated root directory
+        tree_filter (Optional[TreeFilter]): Limits and filters applied while listing
+        
+    Returns:
+        List[os.DirEntry]: Sorted visible entries of the root
+        
+    Raises:
+        PermissionError: If access is denied
+    """
+    try:
+        return read_directory(directory, tree_filter)
+    except PermissionError:
+        raise PermissionError(f"Permission denied to access directory: {directory}")
+
+
+class PrefetchingLister:
+    """
+    Directory lister that lists subdirectories ahead of time on a thread pool.
+    
+    Every time a directory is listed, its subdirectories are submitted to
+    the pool, so sibling directories are listed concurrently while the
+    renderer is still busy with earlier entries. The renderer still asks
+    for listings one by one in tree order, which keeps the output
+    deterministic. The number of listings in flight is bounded to keep
+    memory use bounded on wide trees, and a predicate can rule out
+    subdirectories the traversal will not list, such as unchanged ones
+    reused from a snapshot.
+    """
+    
+    def __init__(
+        self,
+        workers: int,
+        list_directory: Optional[DirectoryLister] = None,
+        max_pending: Optional[int] = None,
+        prefetch: Optional[Callable[[os.DirEntry], bool]] = None
+    ) -> None:
+        # Symlinked directories are not prefetched: they may be cycles or repeats
+        self.list_directory: DirectoryLister = list_directory or read_directory
+        self.prefetch: Optional[Callable[[os.DirEntry], bool]] = prefetch
+        self.max_pending: int = max_pending or workers * PREFETCH_PER_WORKER
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+        self.pending: Dict[str, Future] = {}
+    
+    def __call__(self, directory: str) -> List[os.DirEntry]:
+        future: Optional[Future] = self.pending.pop(directory, None)
+        contents: List[os.DirEntry] = (
+            future.result() if future is not None else self.list_directory(directory)
+        )
+        
+        for entry in contents:
+            if len(self.pending) >= self.max_pending:
+                break
+            try:
+                if entry.is_dir(follow_symlinks=False) and (self.prefetch is None or self.prefetch(entry)):
+                    self.pending[entry.path] = self.executor.submit(self.list_directory, entry.path)
+            except OSError:
+                # The renderer reports inaccessible entries itself
+                continue
         
         return contents
+    
+    def close(self) -> None:
+        """Cancel outstanding prefetches and stop the worker threads."""
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+    
+    def __enter__(self) -> "PrefetchingLister":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _directory_line(name: str, prefix: str, is_last: bool, note: str = "", marker: str = "") -> str:
+    tree_symbol: str = "┗ " if is_last else "┣ "
+    return f"{prefix}{tree_symbol}{marker}{Fore.BLUE}{Style.BRIGHT}📂 {name}{Style.RESET_ALL}{note}"
+
+
+def _status_marker(node: TreeNode) -> str:
+    if node.status == "added":
+        return f"{Fore.GREEN}{Style.BRIGHT}+ {Style.RESET_ALL}"
+    if node.status == "removed":
+        return f"{Fore.RED}{Style.BRIGHT}- {Style.RESET_ALL}"
+    return ""
+
+
+def _link_line(name: str, target: str, prefix: str, is_last: bool, marker: str = "") -> str:
+    item_symbol: str = "┗ " if is_last else "┣ "
+    return f"{prefix}{item_symbol}{marker}{Fore.CYAN}🔗 {name} -> {target}{Style.RESET_ALL}"
+
+
+def _repeat_note() -> str:
+    return f" {Fore.YELLOW}(already shown){Style.RESET_ALL}"
+
+
+def _size_note(node: TreeNode) -> str:
+    if node.is_dir:
+        files: str = "1 file" if node.files == 1 else f"{node.files} files"
+        return f" {Fore.CYAN}({format_size(node.size)}, {files}){Style.RESET_ALL}"
+    return f" {Fore.CYAN}({format_size(node.size)}){Style.RESET_ALL}"
+
+
+def _list_for_render(
+    directory: str,
+    contents: List[os.DirEntry],
+    list_directory: DirectoryLister
+) -> Optional[str]:
+    """
+    List a directory for rendering, turning read errors into messages.
+    
+    Args:
+        directory (str): Directory to list
+        contents (List[os.DirEntry]): List the sorted directory entries are added to
+        list_directory (DirectoryLister): Function listing the directory
         
+    Returns:
+        Optional[str]: Error message, None if the directory was listed
+    """
+    try:
+        contents.extend(list_directory(directory))
     except PermissionError:
-        print(f"{Fore.RED}Permission denied: {directory}")
-        return []
+        return f"Permission denied: {directory}"
     except OSError as e:
-        print(f"{Fore.RED}Error reading directory {directory}: {e}")
-        return []
+        return f"Error reading directory {directory}: {e}"
+    return None
+
+
+def walk_tree(
+    directory: Union[Path, str],
+    list_directory: DirectoryLister = read_directory,
+    follow_symlinks: bool = False
+) -> Iterator[TreeEvent]:
+    """
+    Walk a directory tree depth first and yield one event per entry as it is listed.
+    
+    The traversal keeps an explicit stack of open directories instead of
+    recursing, so the tree depth is not limited by the recursion limit and
+    only the listings of the directories on the current path are held in memory.
+    
+    Symlinks are reported as leaves unless follow_symlinks is set. Every
+    directory is identified by its device and inode, so one reached again
+    through a bind mount or a followed symlink is reported as a repeat
+    instead of being walked again, and symlink cycles end.
+    
+    Args:
+        directory (Union[Path, str]): Directory to walk
+        list_directory (DirectoryLister): Function listing each directory
+        follow_symlinks (bool): Whether to descend into symlinked directories
+        
+    Yields:
+        TreeEvent: (kind, depth, is_last, name, path) of every entry, root first
+    """
+    root: str = os.fspath(directory)
+    yield "dir", 0, True, os.path.basename(root) or root, root
+    
+    visited: InodeSet = InodeSet()
+    try:
+        visited.add(os.stat(root))
+    except OSError:
+        # The listing below reports the problem
+        pass
+    
+    contents: List[os.DirEntry] = []
+    error: Optional[str] = _list_for_render(root, contents, list_directory)
+    if error is not None:
+        yield "listing_error", 0, True, error, root
+    
+    # Each frame: (iterator over the listing, number of entries)
+    stack: List[Tuple[Iterator[Tuple[int, os.DirEntry]], int]] = [(iter(enumerate(contents)), len(contents))]
+    
+    while stack:
+        items, count = stack[-1]
+        depth: int = len(stack)
+        
+        for i, item in items:
+            is_last_item: bool = (i == count - 1)
+            
+            if isinstance(item, MoreEntries):
+                yield "more", depth, is_last_item, item.name, str(item.count)
+                continue
+            
+            try:
+                if item.is_symlink() and not (follow_symlinks and item.is_dir()):
+                    yield "link", depth, is_last_item, item.name, item.path
+                elif item.is_dir():
+                    if not visited.add(item.stat()):
+                        yield "repeat", depth, is_last_item, item.name, item.path
+                        continue
+                    # Descend into subdirectory; the current frame resumes afterwards
+                    yield "dir", depth, is_last_item, item.name, item.path
+                    contents = []
+                    error = _list_for_render(item.path, contents, list_directory)
+                    if error is not None:
+                        yield "listing_error", depth, is_last_item, error, item.path
+                    stack.append((iter(enumerate(contents)), len(contents)))
+                    break
+                else:
+                    yield "file", depth, is_last_item, item.name, item.path
+                    
+            except (PermissionError, OSError):
+                yield "entry_error", depth, is_last_item, item.name, item.path
+        else:
+            stack.pop()
+
 
-def visualize_directory_recursive(
+def iter_tree_lines(
     directory: Path,
     prefix: str = "",
-    is_last: bool = True
-) -> None:
+    is_last: bool = True,
+    list_directory: DirectoryLister = read_directory,
+    follow_symlinks: bool = False
+) -> Iterator[str]:
     """
-    Recursively visualize directory structure.
+    Yield the rendered lines of a directory tree, depth first.
     
     Args:
         directory (Path): Directory to visualize
         prefix (str): Prefix for tree drawing
         is_last (bool): Whether this is the last item in parent
+        list_directory (DirectoryLister): Function listing each directory
+        follow_symlinks (bool): Whether to descend into symlinked directories
+        
+    Yields:
+        str: Rendered output lines without trailing newlines
+    """
+    # prefixes[depth] is the tree drawing prefix of entries at that depth
+    prefixes: List[str] = [prefix]
+    
+    for kind, depth, is_last_item, name, path in walk_tree(directory, list_directory, follow_symlinks):
+        if depth == 0:
+            is_last_item = is_last
+            name = directory.name if directory.name else str(directory)
+        item_prefix: str = prefixes[depth]
+        item_symbol: str = "┗ " if is_last_item else "┣ "
+        
+        if kind == "dir":
+            yield _directory_line(name, item_prefix, is_last_item)
+            del prefixes[depth + 1:]
+            prefixes.append(item_prefix + ("   " if is_last_item else "┃  "))
+        elif kind == "file":
+            yield f"{item_prefix}{item_symbol}{Fore.GREEN}📜 {name}{Style.RESET_ALL}"
+        elif kind == "link":
+            yield _link_line(name, link_target(path), item_prefix, is_last_item)
+        elif kind == "repeat":
+            yield _directory_line(name, item_prefix, is_last_item, _repeat_note())
+        elif kind == "more":
+            yield f"{item_prefix}{item_symbol}{Fore.YELLOW}{name}{Style.RESET_ALL}"
+        elif kind == "entry_error":
+            yield f"{item_prefix}{item_symbol}{Fore.RED}[Error accessing: {name}]{Style.RESET_ALL}"
+        else:
+            yield f"{Fore.RED}{name}{Style.RESET_ALL}"
+
+
+def iter_tree_records(
+    directory: Union[Path, str],
+    list_directory: DirectoryLister = read_directory,
+    follow_symlinks: bool = False
+) -> Iterator[Dict[str, Any]]:
     """
+    Yield one machine-readable record per entry as the tree is walked.
     
-    # Get directory name and apply coloring
-    dir_name: str = directory.name if directory.name else str(directory)
-    colored_name: str = f"{Fore.BLUE}{Style.BRIGHT}📂 {dir_name}{Style.RESET_ALL}"
+    Args:
+        directory (Union[Path, str]): Directory to walk
+        list_directory (DirectoryLister): Function listing each directory
+        follow_symlinks (bool): Whether to descend into symlinked directories
+        
+    Yields:
+        Dict[str, Any]: Record with the "path" relative to the root, "name",
+        "type" ("dir", "file", "link", "more" or "error") and "depth"; links
+        carry their "target" and directories shown before are marked "repeat"
+    """
+    root: str = os.fspath(directory)
+    # Relative paths of the directories on the path to the current entry, indexed by depth
+    parents: List[str] = []
     
-    # Print current directory
-    tree_symbol: str = "┗ " if is_last else "┣ "
-    print(f"{prefix}{tree_symbol}{colored_name}")
+    for kind, depth, _, name, path in walk_tree(root, list_directory, follow_symlinks):
+        if kind == "dir":
+            relative: str = relative_path(root, path)
+            del parents[depth:]
+            parents.append(relative)
+            yield {"path": relative, "name": name, "type": "dir", "depth": depth}
+        elif kind == "file":
+            yield {"path": relative_path(root, path), "name": name, "type": "file", "depth": depth}
+        elif kind == "link":
+            yield {
+                "path": relative_path(root, path), "name": name, "type": "link", "depth": depth,
+                "target": link_target(path)
+            }
+        elif kind == "repeat":
+            yield {"path": relative_path(root, path), "name": name, "type": "dir", "depth": depth, "repeat": True}
+        elif kind == "more":
+            yield {"path": parents[depth - 1], "name": name, "type": "more", "depth": depth, "count": int(path)}
+        elif kind == "entry_error":
+            yield {
+                "path": relative_path(root, path), "name": name, "type": "error", "depth": depth,
+                "error": f"Error accessing: {name}"
+            }
+        else:
+            yield {"path": relative_path(root, path), "name": "", "type": "error", "depth": depth, "error": name}
+
+
+def iter_node_records(node: TreeNode) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one machine-readable record per node of a scanned tree.
     
-    # Prepare prefix for children
-    child_prefix: str = prefix + ("   " if is_last else "┃  ")
+    Args:
+        node (TreeNode): Root node of the tree
+        
+    Yields:
+        Dict[str, Any]: Record with the "path" relative to the root, "name",
+        "type", "depth", "size" and "files", plus "status" in a diff and
+        "error" when the entry could not be read
+    """
+    root: str = node.path
+    # Each frame: (node, depth); directories with collapsed children leave a "more" record behind them
+    stack: List[Tuple[Union[TreeNode, Dict[str, Any]], int]] = [(node, 0)]
     
-    # Get directory contents
-    contents: List[Path] = get_directory_contents(directory)
+    while stack:
+        current, depth = stack.pop()
+        if isinstance(current, dict):
+            yield current
+            continue
+        
+        record: Dict[str, Any] = {
+            "path": relative_path(root, current.path),
+            "name": current.name,
+            "type": "dir" if current.is_dir else (
+                "link" if current.target is not None else ("error" if current.error else "file")
+            ),
+            "depth": depth,
+            "size": current.size,
+            "files": current.files,
+        }
+        if current.target is not None:
+            record["target"] = current.target
+        if current.repeat:
+            record["repeat"] = True
+        if current.status:
+            record["status"] = current.status
+        if current.error:
+            record["error"] = current.error
+        yield record
+        
+        if current.omitted:
+            stack.append(({
+                "path": record["path"],
+                "name": f"… {current.omitted} more",
+                "type": "more",
+                "depth": depth + 1,
+                "count": current.omitted,
+                "size": current.omitted_size,
+            }, depth + 1))
+        stack.extend((child, depth + 1) for child in reversed(current.children))
+
+
+def iter_record_lines(records: Iterable[Dict[str, Any]], output_format: str) -> Iterator[str]:
+    """
+    Serialize records one line at a time as they arrive.
     
-    if not contents:
+    Args:
+        records (Iterable[Dict[str, Any]]): Records from iter_tree_records or iter_node_records
+        output_format (str): "plain", "json" or "ndjson"
+        
+    Yields:
+        str: Output lines without trailing newlines
+    """
+    if output_format == "plain":
+        for record in records:
+            if record["type"] == "dir":
+                yield record["path"] + "/"
+            elif record["type"] in ("file", "link"):
+                yield record["path"]
+            elif record["type"] == "more":
+                # Collapsed entries are listed under their directory as "dir/… N more"
+                yield record["name"] if record["path"] == "." else f"{record['path']}/{record['name']}"
+            elif record["type"] == "error":
+                sys.stderr.write(f"Error: {record['error']}\n")
         return
     
-    # Process each item in directory
-    for i, item in enumerate(contents):
-        is_last_item: bool = (i == len(contents) - 1)
-        item_symbol: str = "┗ " if is_last_item else "┣ "
+    if output_format == "ndjson":
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False)
+        return
+    
+    # JSON array: hold one record back so the last one is written without a comma
+    yield "["
+    previous: Optional[str] = None
+    for record in records:
+        if previous is not None:
+            yield f"  {previous},"
+        previous = json.dumps(record, ensure_ascii=False)
+    if previous is not None:
+        yield f"  {previous}"
+    yield "]"
+
+
+def iter_node_lines(
+    node: TreeNode,
+    prefix: str = "",
+    is_last: bool = True,
+    show_sizes: bool = True
+) -> Iterator[str]:
+    """
+    Yield the rendered lines of a scanned tree.
+    
+    Entries marked as added or removed by a snapshot diff are prefixed
+    with a green "+" or a red "-".
+    
+    Args:
+        node (TreeNode): Root node of the tree
+        prefix (str): Prefix for tree drawing
+        is_last (bool): Whether this is the last item in parent
+        show_sizes (bool): Whether to annotate entries with sizes and file counts
         
-        try:
-            if item.is_dir():
-                # Recursively process subdirectory
-                visualize_directory_recursive(
-                    item,
-                    child_prefix,
-                    is_last_item
+    Yields:
+        str: Rendered output lines without trailing newlines
+    """
+    stack: List[Tuple[Iterator[Tuple[int, TreeNode]], int, str, TreeNode]] = []
+    pending: Optional[Tuple[TreeNode, str, bool]] = (node, prefix, is_last)
+    
+    while True:
+        if pending is not None:
+            directory, dir_prefix, dir_is_last = pending
+            pending = None
+            yield _directory_line(
+                directory.name,
+                dir_prefix,
+                dir_is_last,
+                _repeat_note() if directory.repeat else (_size_note(directory) if show_sizes else ""),
+                _status_marker(directory)
+            )
+            if directory.error:
+                yield f"{Fore.RED}{directory.error}{Style.RESET_ALL}"
+            
+            count: int = len(directory.children) + (1 if directory.omitted else 0)
+            stack.append((
+                iter(enumerate(directory.children)),
+                count,
+                dir_prefix + ("   " if dir_is_last else "┃  "),
+                directory
+            ))
+        
+        if not stack:
+            return
+        
+        items, count, item_prefix, directory = stack[-1]
+        
+        for i, child in items:
+            is_last_item: bool = (i == count - 1)
+            item_symbol: str = "┗ " if is_last_item else "┣ "
+            
+            if child.is_dir:
+                pending = (child, item_prefix, is_last_item)
+                break
+            elif child.target is not None:
+                yield _link_line(child.name, child.target, item_prefix, is_last_item, _status_marker(child))
+            elif child.error:
+                yield f"{item_prefix}{item_symbol}{Fore.RED}[Error accessing: {child.name}]{Style.RESET_ALL}"
+            else:
+                yield (
+                    f"{item_prefix}{item_symbol}{_status_marker(child)}{Fore.GREEN}📜 {child.name}{Style.RESET_ALL}"
+                    f"{_size_note(child) if show_sizes else ''}"
                 )
+        else:
+            stack.pop()
+            if directory.omitted:
+                note: str = f" {Fore.CYAN}({format_size(directory.omitted_size)}){Style.RESET_ALL}" if show_sizes else ""
+                yield f"{item_prefix}┗ {Fore.YELLOW}… {directory.omitted} more{Style.RESET_ALL}{note}"
+
+
+# Rendered lines of a directory subtree; nested lists are the blocks of its subdirectories
+LineBlock = List[Union[str, list]]
+
+
+class SubtreeRenderer:
+    """
+    Renderer of a scanned tree that keeps the lines of every directory subtree.
+    
+    A subtree is rendered again only when it is marked as changed or when
+    its position in the drawing (prefix or last-child state) changed;
+    otherwise its previous block of lines is reused. Blocks nest instead of
+    being copied into their parents, so reusing a block costs nothing.
+    """
+    
+    def __init__(
+        self,
+        show_sizes: bool = False,
+        max_depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        sort_by_size: bool = False
+    ) -> None:
+        self.show_sizes: bool = show_sizes
+        self.max_depth: Optional[int] = max_depth
+        self.limit: Optional[int] = limit
+        self.sort_by_size: bool = sort_by_size
+        # Directory path -> (node, prefix, is_last, depth, block)
+        self.blocks: Dict[str, Tuple[TreeNode, str, bool, int, LineBlock]] = {}
+        # Number of subtrees rendered by the last call to render()
+        self.rendered: int = 0
+    
+    def discard(self, paths: Iterable[str]) -> None:
+        """
+        Forget the blocks of directories that no longer exist.
+        
+        Args:
+            paths (Iterable[str]): Directory paths
+        """
+        for path in paths:
+            self.blocks.pop(path, None)
+    
+    def _visible_children(self, node: TreeNode, depth: int) -> Tuple[List[TreeNode], int, int]:
+        # Children shown under the display limits, with the number and size of the rest
+        if self.max_depth is not None and depth >= self.max_depth:
+            return [], 0, 0
+        children: List[TreeNode] = node.children
+        if self.sort_by_size:
+            children = sorted(children, key=lambda child: child.size, reverse=True)
+        if self.limit is not None and len(children) > self.limit:
+            collapsed: List[TreeNode] = children[self.limit:]
+            return children[:self.limit], len(collapsed), sum(child.size for child in collapsed if child.counted)
+        return children, 0, 0
+    
+    def _reusable(self, node: TreeNode, prefix: str, is_last: bool, changed: Set[str]) -> Optional[LineBlock]:
+        cached = self.blocks.get(node.path)
+        if cached is None or node.path in changed:
+            return None
+        cached_node, cached_prefix, cached_is_last, _, block = cached
+        if cached_node is not node or cached_prefix != prefix or cached_is_last != is_last:
+            return None
+        return block
+    
+    def _entry_line(self, child: TreeNode, prefix: str, is_last: bool) -> str:
+        item_symbol: str = "┗ " if is_last else "┣ "
+        if child.target is not None:
+            return _link_line(child.name, child.target, prefix, is_last)
+        if child.error:
+            return f"{prefix}{item_symbol}{Fore.RED}[Error accessing: {child.name}]{Style.RESET_ALL}"
+        return (
+            f"{prefix}{item_symbol}{Fore.GREEN}📜 {child.name}{Style.RESET_ALL}"
+            f"{_size_note(child) if self.show_sizes else ''}"
+        )
+    
+    def render(self, root: TreeNode, changed: Iterable[str] = ()) -> LineBlock:
+        """
+        Render the tree, reusing the blocks of unchanged subtrees.
+        
+        Args:
+            root (TreeNode): Root node of the tree
+            changed (Iterable[str]): Directories whose nodes changed since the last render
+            
+        Returns:
+            LineBlock: Lines of the whole tree
+        """
+        changed = set(changed)
+        self.rendered = 0
+        
+        cached: Optional[LineBlock] = self._reusable(root, "", True, changed)
+        if cached is not None:
+            return cached
+        
+        # Each frame: (node, prefix, is_last, depth, block, iterator over visible children, count, omitted)
+        stack: List[Tuple[TreeNode, str, bool, int, LineBlock, Iterator[Tuple[int, TreeNode]], int, Tuple[int, int]]] = []
+        
+        def open_frame(node: TreeNode, prefix: str, is_last: bool, depth: int) -> None:
+            self.rendered += 1
+            note: str = _repeat_note() if node.repeat else (_size_note(node) if self.show_sizes else "")
+            block: LineBlock = [_directory_line(node.name, prefix, is_last, note)]
+            if node.error:
+                block.append(f"{Fore.RED}{node.error}{Style.RESET_ALL}")
+            children, omitted, omitted_size = self._visible_children(node, depth)
+            count: int = len(children) + (1 if omitted else 0)
+            stack.append((node, prefix, is_last, depth, block, iter(enumerate(children)), count, (omitted, omitted_size)))
+        
+        open_frame(root, "", True, 0)
+        
+        while True:
+            node, prefix, is_last, depth, block, items, count, (omitted, omitted_size) = stack[-1]
+            item_prefix: str = prefix + ("   " if is_last else "┃  ")
+            
+            for i, child in items:
+                is_last_item: bool = (i == count - 1)
+                if not child.is_dir:
+                    block.append(self._entry_line(child, item_prefix, is_last_item))
+                    continue
+                reused: Optional[LineBlock] = self._reusable(child, item_prefix, is_last_item, changed)
+                if reused is not None:
+                    block.append(reused)
+                    continue
+                open_frame(child, item_prefix, is_last_item, depth + 1)
+                break
             else:
-                # Process file
-                colored_file: str = f"{Fore.GREEN}📜 {item.name}{Style.RESET_ALL}"
-                print(f"{child_prefix}{item_symbol}{colored_file}")
+                stack.pop()
+                if omitted:
+                    note: str = f" {Fore.CYAN}({format_size(omitted_size)}){Style.RESET_ALL}" if self.show_sizes else ""
+                    block.append(f"{item_prefix}┗ {Fore.YELLOW}… {omitted} more{Style.RESET_ALL}{note}")
+                self.blocks[node.path] = (node, prefix, is_last, depth, block)
+                if not stack:
+                    return block
+                stack[-1][4].append(block)
+
+
+def iter_block_lines(block: LineBlock) -> Iterator[str]:
+    """
+    Yield the lines of a nested block in order.
+    
+    Args:
+        block (LineBlock): Rendered block
+        
+    Yields:
+        str: Output lines without trailing newlines
+    """
+    stack: List[Iterator[Union[str, list]]] = [iter(block)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            yield item
+        else:
+            stack.pop()
+
+
+def write_lines(lines: Iterable[str], stream: Optional[TextIO] = None) -> None:
+    """
+    Write lines to a stream in large batches instead of one write per line.
+    
+    Args:
+        lines (Iterable[str]): Lines without trailing newlines
+        stream (Optional[TextIO]): Output stream, sys.stdout by default
+    """
+    output: TextIO = stream if stream is not None else sys.stdout
+    batch: List[str] = []
+    
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= WRITE_BATCH_LINES:
+            batch.append("")
+            with span("output"):
+                output.write("\n".join(batch))
+            batch.clear()
+    
+    with span("output"):
+        if batch:
+            batch.append("")
+            output.write("\n".join(batch))
+        output.flush()
+
+
+def visualize_directory(
+    directory: Path,
+    prefix: str = "",
+    is_last: bool = True,
+    workers: int = 1,
+    tree_filter: Optional[TreeFilter] = None,
+    output_format: str = "tree",
+    root_entries: Optional[List[os.DirEntry]] = None,
+    follow_symlinks: bool = False
+) -> None:
+    """
+    Visualize directory structure.
+    
+    Args:
+        directory (Path): Directory to visualize
+        prefix (str): Prefix for tree drawing
+        is_last (bool): Whether this is the last item in parent
+        workers (int): Number of threads listing directories ahead of rendering
+        tree_filter (Optional[TreeFilter]): Limits and filters applied while listing
+        output_format (str): One of OUTPUT_FORMATS
+        root_entries (Optional[List[os.DirEntry]]): Listing of the root made up front
+        follow_symlinks (bool): Whether to descend into symlinked directories
+    """
+    # Listing, rendering and output are interleaved; the walk's self time is the rendering
+    with directory_lister(workers, tree_filter, (os.fspath(directory), root_entries)) as list_directory, \
+            span("walk"):
+        if output_format == "tree":
+            write_lines(iter_tree_lines(directory, prefix, is_last, list_directory, follow_symlinks))
+        else:
+            records: Iterator[Dict[str, Any]] = iter_tree_records(directory, list_directory, follow_symlinks)
+            write_lines(iter_record_lines(records, output_format))
+
+
+def visualize_directory_model(
+    directory: Path,
+    workers: int = 1,
+    tree_filter: Optional[TreeFilter] = None,
+    max_depth: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort_by_size: bool = False,
+    show_sizes: bool = True,
+    snapshot_path: Optional[str] = None,
+    diff: bool = False,
+    output_format: str = "tree",
+    root_entries: Optional[List[os.DirEntry]] = None,
+    follow_symlinks: bool = False
+) -> None:
+    """
+    Visualize directory structure from a complete in-memory scan.
+    
+    The tree is scanned completely in one pass and rendered once the sizes
+    are aggregated, so depth and entry limits only restrict what is shown.
+    With a snapshot file, the previous scan is reused for directories whose
+    modification time has not changed and the new scan is saved afterwards.
+    
+    Args:
+        directory (Path): Directory to visualize
+        workers (int): Number of threads listing directories ahead of rendering
+        tree_filter (Optional[TreeFilter]): Filters applied while listing
+        max_depth (Optional[int]): Deepest level whose directories show their children
+        limit (Optional[int]): Maximum number of entries shown per directory
+        sort_by_size (bool): Whether to order entries by size, largest first
+        show_sizes (bool): Whether to annotate entries with sizes and file counts
+        snapshot_path (Optional[str]): Snapshot file to reuse and update
+        diff (bool): Whether to show only entries added or removed since the snapshot
+        output_format (str): One of OUTPUT_FORMATS
+        root_entries (Optional[List[os.DirEntry]]): Listing of the root made up front
+        follow_symlinks (bool): Whether to scan symlinked directories
+        
+    Raises:
+        OSError: If the root cannot be stat'ed or listed during a snapshot scan
+    """
+    root_path: str = os.fspath(directory)
+    previous: Optional[TreeNode] = None
+    signature: str = _filter_signature(tree_filter, follow_symlinks)
+    
+    if snapshot_path is not None:
+        with span("load snapshot"):
+            previous = load_snapshot(snapshot_path, root_path, signature)
+        # Unchanged directories reuse their snapshot listing, so listing them ahead would be wasted
+        prefetch: Optional[Callable[[os.DirEntry], bool]] = None
+        if previous is not None and workers > 1:
+            prefetch = partial(needs_listing, index_directories(previous))
+        with directory_lister(workers, tree_filter, (root_path, root_entries), prefetch) as list_directory, \
+                span("scan"):
+            root: TreeNode = build_tree(
+                root_path, list_directory, previous=previous, track_mtimes=True, follow_symlinks=follow_symlinks,
+                on_reuse=tree_filter.load_ignore_file if tree_filter is not None and tree_filter.gitignore else None
+            )
+        if root.error is not None:
+            # The root was not listed up front, so this is the first sign that it cannot be read
+            raise OSError(root.error)
+        with span("save snapshot"):
+            save_snapshot(snapshot_path, root, signature)
+        
+        if diff:
+            if previous is None:
+                print(
+                    f"{Fore.YELLOW}No usable snapshot found; every entry is shown as added.{Style.RESET_ALL}",
+                    file=sys.stdout if output_format == "tree" else sys.stderr
+                )
+                previous = TreeNode(root.name, root_path, True)
+            with span("diff"):
+                root = diff_trees(previous, root)
+        
+        with span("trim"):
+            trim_tree(root, max_depth, limit, sort_by_size)
+    else:
+        with directory_lister(workers, tree_filter, (root_path, root_entries)) as list_directory, span("scan"):
+            root = build_tree(
+                root_path, list_directory, max_depth, limit, sort_by_size, follow_symlinks=follow_symlinks
+            )
+    
+    with span("render"):
+        if output_format == "tree":
+            write_lines(iter_node_lines(root, show_sizes=show_sizes))
+        else:
+            write_lines(iter_record_lines(iter_node_records(root), output_format))
+
+
+def watch_directory(
+    directory: Path,
+    workers: int = 1,
+    tree_filter: Optional[TreeFilter] = None,
+    max_depth: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort_by_size: bool = False,
+    show_sizes: bool = False,
+    root_entries: Optional[List[os.DirEntry]] = None,
+    follow_symlinks: bool = False,
+    poll: bool = False
+) -> None:
+    """
+    Show the tree and redraw it whenever the directory changes, until interrupted.
+    
+    After the initial scan only the directories reported by the watcher are
+    scanned again, and only their subtrees and ancestors are rendered again.
+    On a terminal each update replaces the previous drawing; otherwise the
+    updated trees are written one after another, separated by a blank line.
+    
+    Args:
+        directory (Path): Directory to watch
+        workers (int): Number of threads listing directories ahead of the scan
+        tree_filter (Optional[TreeFilter]): Filters applied while listing
+        max_depth (Optional[int]): Deepest level whose directories show their children
+        limit (Optional[int]): Maximum number of entries shown per directory
+        sort_by_size (bool): Whether to order entries by size, largest first
+        show_sizes (bool): Whether to annotate entries with sizes and file counts
+        root_entries (Optional[List[os.DirEntry]]): Listing of the root made up front
+        follow_symlinks (bool): Whether to scan symlinked directories
+        poll (bool): Whether to poll directory modification times instead of using inotify
+    """
+    root_path: str = os.fspath(directory)
+    renderer: SubtreeRenderer = SubtreeRenderer(show_sizes, max_depth, limit, sort_by_size)
+    terminal: bool = sys.stdout.isatty()
+    
+    # Rescans reuse the listings of unchanged directories, so only changed ones are listed ahead
+    directories: Dict[str, TreeNode] = {}
+    prefetch: Callable[[os.DirEntry], bool] = partial(needs_listing, directories)
+    
+    with directory_lister(workers, tree_filter, (root_path, root_entries), prefetch) as list_directory:
+        with span("scan"):
+            tree: WatchedTree = WatchedTree(root_path, list_directory, follow_symlinks, directories)
+        changed: Set[str] = set()
+        
+        watcher: DirectoryWatcher = create_watcher(
+            root_path, tree.directories, poll, follow_symlinks=follow_symlinks
+        )
+        try:
+            while True:
+                with span("render"):
+                    block: LineBlock = renderer.render(tree.root, changed)
+                    sys.stdout.write(CLEAR_SCREEN if terminal else "")
+                    write_lines(iter_block_lines(block))
                 
-        except (PermissionError, OSError) as e:
-            error_msg: str = f"{Fore.RED}[Error accessing: {item.name}]{Style.RESET_ALL}"
-            print(f"{child_prefix}{item_symbol}{error_msg}")
+                events: Set[str] = wait_for_changes(watcher)
+                with span("rescan"):
+                    changed, added, removed = tree.update(events)
+                for path in removed:
+                    watcher.remove(path)
+                try:
+                    for path in added:
+                        watcher.add(path)
+                except OSError:
+                    # Out of inotify watches, or an entry that cannot be watched
+                    watcher.close()
+                    watcher = create_watcher(root_path, tree.directories, poll=True)
+                renderer.discard(removed)
+                if not terminal:
+                    sys.stdout.write("\n")
+        except KeyboardInterrupt:
+            return
+        finally:
+            watcher.close()
+
+
+def _filter_signature(tree_filter: Optional[TreeFilter], follow_symlinks: bool = False) -> str:
+    """
+    Describe the filters that decide which entries a scan contains.
+    
+    Args:
+        tree_filter (Optional[TreeFilter]): Filters applied while listing
+        follow_symlinks (bool): Whether symlinked directories are scanned
+        
+    Returns:
+        str: Signature stored with snapshots
+    """
+    signature: Dict[str, Any] = {"follow_symlinks": True} if follow_symlinks else {}
+    if tree_filter is not None:
+        signature.update({
+            "include": [pattern.pattern for _, pattern in tree_filter.include],
+            "exclude": [pattern.pattern for _, pattern in tree_filter.exclude],
+            "gitignore": tree_filter.gitignore,
+        })
+    return json.dumps(signature)
+
+
+def _reuse_listing(
+    list_directory: DirectoryLister,
+    directory: str,
+    entries: List[os.DirEntry]
+) -> DirectoryLister:
+    """
+    Wrap a lister so that one directory is answered from an existing listing once.
+    
+    Args:
+        list_directory (DirectoryLister): Function listing each directory
+        directory (str): Directory that was already listed
+        entries (List[os.DirEntry]): Its listing
+        
+    Returns:
+        DirectoryLister: Lister returning the existing listing on the first request
+    """
+    known: Dict[str, List[os.DirEntry]] = {directory: entries}
+    
+    def reuse(path: str) -> List[os.DirEntry]:
+        cached: Optional[List[os.DirEntry]] = known.pop(path, None)
+        return cached if cached is not None else list_directory(path)
+    
+    return reuse
+
+
+@contextmanager
+def directory_lister(
+    workers: int = 1,
+    tree_filter: Optional[TreeFilter] = None,
+    known_listing: Optional[Tuple[str, Optional[List[os.DirEntry]]]] = None,
+    prefetch: Optional[Callable[[os.DirEntry], bool]] = None
+) -> Iterator[DirectoryLister]:
+    """
+    Provide the directory lister for a traversal.
+    
+    Args:
+        workers (int): Number of threads listing directories ahead of the traversal
+        tree_filter (Optional[TreeFilter]): Limits and filters applied while listing
+        known_listing (Optional[Tuple[str, Optional[List[os.DirEntry]]]]): Directory
+            path and its listing, returned the first time that directory is listed
+        prefetch (Optional[Callable[[os.DirEntry], bool]]): Chooses the subdirectories
+            listed ahead of the traversal; all of them by default
+        
+    Yields:
+        DirectoryLister: Function listing each directory
+    """
+    list_directory: DirectoryLister = read_directory
+    if tree_filter is not None and tree_filter.active:
+        list_directory = partial(read_directory, tree_filter=tree_filter)
+    
+    if known_listing is not None and known_listing[1] is not None:
+        list_directory = _reuse_listing(list_directory, *known_listing)
+    
+    if workers <= 1:
+        yield timed("list", list_directory)
+        return
+    
+    # With prefetching, the time spent waiting for listings is what the traversal sees
+    with PrefetchingLister(workers, list_directory, prefetch=prefetch) as lister:
+        yield timed("list", lister)
+
 
 def main() -> None:
+    # Parse command line arguments
+    parser: argparse.ArgumentParser = setup_argument_parser()
+    args = parser.parse_args()
+    
+    with profile_session(args):
+        run(parser, args)
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    Visualize the directory given on the command line.
+    
+    Args:
+        parser (argparse.ArgumentParser): Parser used to report option errors
+        args (argparse.Namespace): Parsed command line arguments
+    """
+    machine_output: bool = args.format != "tree"
+    
+    # Colours are only used for the tree; the other formats stay plain text
+    setup_color("never" if machine_output else args.color)
+    # Machine-readable formats keep stdout for records and report problems on stderr
+    messages: TextIO = sys.stderr if machine_output else sys.stdout
+    
     try:
-        # Parse command line arguments
-        parser: argparse.ArgumentParser = setup_argument_parser()
-        args = parser.parse_args()
-        
         # Validate directory path
         directory: Path = validate_directory_path(args.directory_path)
         
+        if args.diff and args.snapshot is None:
+            parser.error("--diff requires --snapshot")
+        if args.watch and (machine_output or args.snapshot is not None):
+            parser.error("--watch only works with the tree format and without --snapshot")
+        if args.poll and not args.watch:
+            parser.error("--poll requires --watch")
+        
+        sort_by_size: bool = args.sort_size or args.top is not None
+        show_sizes: bool = args.sizes or sort_by_size
+        use_model: bool = show_sizes or args.snapshot is not None or args.watch
+        
+        # Sizes and snapshots need the whole tree; the limits only apply to the display
+        tree_filter: TreeFilter = TreeFilter(
+            directory,
+            max_depth=None if use_model else args.max_depth,
+            max_entries=None if use_model else args.max_entries_per_dir,
+            include=args.include,
+            exclude=args.exclude,
+            gitignore=args.gitignore
+        )
+        # A snapshot scan usually reuses the root listing, so the root is only checked when scanned
+        root_entries: Optional[List[os.DirEntry]] = (
+            list_root_directory(directory, tree_filter) if args.snapshot is None else None
+        )
+        
         # Visualize directory structure
-        visualize_directory_recursive(directory)
+        if args.watch:
+            watch_directory(
+                directory,
+                workers=args.workers,
+                tree_filter=tree_filter,
+                max_depth=args.max_depth,
+                limit=args.top if args.top is not None else args.max_entries_per_dir,
+                sort_by_size=sort_by_size,
+                show_sizes=show_sizes,
+                root_entries=root_entries,
+                follow_symlinks=args.follow_symlinks,
+                poll=args.poll
+            )
+        elif use_model:
+            visualize_directory_model(
+                directory,
+                workers=args.workers,
+                tree_filter=tree_filter,
+                max_depth=args.max_depth,
+                limit=args.top if args.top is not None else args.max_entries_per_dir,
+                sort_by_size=sort_by_size,
+                show_sizes=show_sizes,
+                snapshot_path=args.snapshot,
+                diff=args.diff,
+                output_format=args.format,
+                root_entries=root_entries,
+                follow_symlinks=args.follow_symlinks
+            )
+        else:
+            visualize_directory(
+                directory,
+                workers=args.workers,
+                tree_filter=tree_filter,
+                output_format=args.format,
+                root_entries=root_entries,
+                follow_symlinks=args.follow_symlinks
+            )
         
     except KeyboardInterrupt:
-        print(f"\n{Fore.YELLOW}Operation cancelled by user.{Style.RESET_ALL}")
+        print(f"\n{Fore.YELLOW}Operation cancelled by user.{Style.RESET_ALL}", file=messages)
         sys.exit(1)
         
     except (FileNotFoundError, NotADirectoryError, PermissionError, OSError) as e:
-        print(f"{Fore.RED}Error: {e}{Style.RESET_ALL}")
+        print(f"{Fore.RED}Error: {e}{Style.RESET_ALL}", file=messages)
         sys.exit(1)
         
     except Exception as e:
-        print(f"{Fore.RED}Unexpected error: {e}{Style.RESET_ALL}")
+        print(f"{Fore.RED}Unexpected error: {e}{Style.RESET_ALL}", file=messages)
         sys.exit(1)
 
 
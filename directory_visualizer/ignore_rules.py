@@ -0,0 +1,191 @@
+"""
+.gitignore-style ignore rules
+
+Parses .gitignore files and matches paths against them the way git does:
+patterns without a slash match a name at any depth, patterns with a slash
+are anchored to the directory of the .gitignore file, a trailing slash
+matches directories only, "!" re-includes a path, and the last matching
+rule wins, with rules of deeper .gitignore files taking precedence.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Pattern
+
+from tree_model import relative_path
+
+
+def translate_glob(pattern: str) -> str:
+    """
+    Translate a gitignore glob into a regular expression.
+
+    Args:
+        pattern (str): Glob pattern without the leading "!" or trailing "/"
+
+    Returns:
+        str: Regular expression matching the whole path
+    """
+    result: List[str] = []
+    i: int = 0
+    length: int = len(pattern)
+
+    while i < length:
+        char: str = pattern[i]
+
+        if char == "*":
+            if pattern.startswith("**/", i):
+                result.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i) and i + 2 == length:
+                result.append(".*")
+                i += 2
+                continue
+            result.append("[^/]*")
+        elif char == "?":
+            result.append("[^/]")
+        elif char == "[":
+            j: int = i + 1
+            if j < length and pattern[j] == "!":
+                j += 1
+            if j < length and pattern[j] == "]":
+                j += 1
+            end: int = pattern.find("]", j)
+            if end == -1:
+                result.append(re.escape(char))
+            else:
+                body: str = pattern[i + 1:end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                result.append(f"[{body}]")
+                i = end
+        elif char == "\\" and i + 1 < length:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(char))
+        i += 1
+
+    return "".join(result)
+
+
+class IgnoreRule:
+    """
+    A single parsed .gitignore pattern.
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.negated: bool = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+
+        self.dir_only: bool = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        # A slash anywhere but at the end anchors the pattern to its .gitignore
+        self.anchored: bool = "/" in pattern
+        pattern = pattern.lstrip("/")
+
+        self.regex: Pattern[str] = re.compile(translate_glob(pattern) + r"\Z", re.DOTALL)
+
+    def matches(self, relative_path: str, is_dir: bool) -> bool:
+        """
+        Check whether the rule matches a path.
+
+        Args:
+            relative_path (str): Path relative to the .gitignore directory, "/"-separated
+            is_dir (bool): Whether the path is a directory
+
+        Returns:
+            bool: True if the rule matches
+        """
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return self.regex.match(relative_path) is not None
+        return self.regex.match(relative_path.rsplit("/", 1)[-1]) is not None
+
+
+class IgnoreRules:
+    """
+    Rules of one .gitignore file, chained to the rules of its parent directories.
+    """
+
+    def __init__(
+        self,
+        base: str,
+        rules: List[IgnoreRule],
+        parent: Optional["IgnoreRules"] = None
+    ) -> None:
+        self.base: str = base
+        self.rules: List[IgnoreRule] = rules
+        self.parent: Optional[IgnoreRules] = parent
+
+    @classmethod
+    def from_lines(
+        cls,
+        base: str,
+        lines: Iterable[str],
+        parent: Optional["IgnoreRules"] = None
+    ) -> "IgnoreRules":
+        """
+        Parse .gitignore lines.
+
+        Args:
+            base (str): Directory containing the .gitignore file
+            lines (Iterable[str]): Lines of the file
+            parent (Optional[IgnoreRules]): Rules of the parent directories
+
+        Returns:
+            IgnoreRules: Parsed rules
+        """
+        rules: List[IgnoreRule] = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip(" \t")
+            if not line or line.startswith("#"):
+                continue
+            rules.append(IgnoreRule(line))
+        return cls(base, rules, parent)
+
+    @classmethod
+    def from_file(
+        cls,
+        path: str,
+        parent: Optional["IgnoreRules"] = None
+    ) -> "IgnoreRules":
+        """
+        Parse a .gitignore file.
+
+        Args:
+            path (str): Path to the .gitignore file
+            parent (Optional[IgnoreRules]): Rules of the parent directories
+
+        Returns:
+            IgnoreRules: Parsed rules
+        """
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            return cls.from_lines(os.path.dirname(path), file, parent)
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        Check whether a path is ignored.
+
+        Args:
+            path (str): Path inside the base directory
+            is_dir (bool): Whether the path is a directory
+
+        Returns:
+            bool: True if the last matching rule ignores the path
+        """
+        rules: Optional[IgnoreRules] = self
+        while rules is not None:
+            relative: str = relative_path(rules.base, path)
+            for rule in reversed(rules.rules):
+                if rule.matches(relative, is_dir):
+                    return not rule.negated
+            rules = rules.parent
+        return False
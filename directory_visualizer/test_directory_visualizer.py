@@ -0,0 +1,739 @@
+import unittest
+import io
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+from directory_visualizer import (
+    iter_tree_lines, iter_node_lines, iter_tree_records, iter_node_records, iter_record_lines,
+    read_directory, write_lines, directory_lister, list_root_directory, setup_color, iter_block_lines,
+    setup_argument_parser, main, PrefetchingLister, SubtreeRenderer, TreeFilter
+)
+from ignore_rules import IgnoreRules
+from tree_model import build_tree, format_size, index_directories, needs_listing, relative_path
+from tree_snapshot import diff_trees, load_snapshot, save_snapshot
+from tree_watch import DirectoryWatcher, InotifyWatcher, PollingWatcher, WatchedTree, wait_for_changes
+
+
+ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def render_recursive(directory: Path, prefix: str = "", is_last: bool = True) -> List[str]:
+    """Render a tree the way the original recursive pathlib renderer did, without colours."""
+    lines: List[str] = [f"{prefix}{'┗ ' if is_last else '┣ '}📂 {directory.name}"]
+    child_prefix: str = prefix + ("   " if is_last else "┃  ")
+    contents: List[Path] = sorted(
+        (item for item in directory.iterdir() if not item.name.startswith(".")),
+        key=lambda item: (item.is_file(), item.name.lower())
+    )
+    for index, item in enumerate(contents):
+        is_last_item: bool = index == len(contents) - 1
+        if item.is_dir():
+            lines.extend(render_recursive(item, child_prefix, is_last_item))
+        else:
+            lines.append(f"{child_prefix}{'┗ ' if is_last_item else '┣ '}📜 {item.name}")
+    return lines
+
+
+def render(directory: Path, **kwargs) -> List[str]:
+    """Render a tree and strip colour codes from the lines."""
+    return [ANSI_PATTERN.sub("", line) for line in iter_tree_lines(directory, **kwargs)]
+
+
+class TestDirectoryVisualizer(unittest.TestCase):
+    """Test suite for directory listing and tree rendering."""
+
+    def setUp(self) -> None:
+        """Create a temporary directory for each test."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root: Path = Path(self.temp_dir.name) / "root"
+        self.root.mkdir()
+
+    def tearDown(self) -> None:
+        """Remove the temporary directory."""
+        self.temp_dir.cleanup()
+
+    def make_tree(self, *paths: str) -> None:
+        """Create files and directories (paths ending with '/') under the root."""
+        for relative in paths:
+            path: Path = self.root / relative
+            if relative.endswith("/"):
+                path.mkdir(parents=True, exist_ok=True)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.touch()
+
+    def test_sample_tree(self) -> None:
+        """Test rendering of the bundled sample directory."""
+        lines: List[str] = render(Path("test_directories/sample1").resolve())
+
+        self.assertEqual(lines, [
+            "┗ 📂 sample1",
+            "   ┣ 📂 subfolder1",
+            "   ┃  ┗ 📜 data.json",
+            "   ┣ 📜 readme.txt",
+            "   ┗ 📜 script.py",
+        ])
+
+    def test_directories_first_and_hidden_skipped(self) -> None:
+        """Test ordering: directories first, case-insensitive, hidden entries skipped."""
+        self.make_tree("b.txt", "A.txt", ".hidden", ".git/config", "zeta/", "Alpha/")
+
+        names: List[str] = [entry.name for entry in read_directory(self.root)]
+
+        self.assertEqual(names, ["Alpha", "zeta", "A.txt", "b.txt"])
+
+    def test_listing_makes_no_stat_calls(self) -> None:
+        """Test that listing and rendering use the file types reported by os.scandir."""
+        self.make_tree("dir/file.txt", "dir/sub/", "file.txt", "Other.txt")
+
+        # pathlib's is_dir()/is_file() go through os.stat once per entry; DirEntry's cached
+        # types do not, so only the root is stat'ed (to recognise repeated directories)
+        with mock.patch("os.stat", wraps=os.stat) as stat:
+            lines: List[str] = render(self.root)
+
+        self.assertEqual(stat.call_count, 1)
+        self.assertEqual(lines, render_recursive(self.root))
+
+    def test_empty_directory(self) -> None:
+        """Test rendering of an empty directory."""
+        self.assertEqual(render(self.root), ["┗ 📂 root"])
+
+    def test_deep_tree_without_recursion_limit(self) -> None:
+        """Test that trees deeper than the recursion limit render completely."""
+        depth: int = 1200
+        deepest: str = str(self.root)
+        for _ in range(depth):
+            deepest = os.path.join(deepest, "d")
+            os.mkdir(deepest)
+        open(os.path.join(deepest, "leaf.txt"), "w").close()
+
+        try:
+            lines: List[str] = render(self.root)
+        finally:
+            # shutil.rmtree recurses per level too, so remove the chain bottom-up
+            os.remove(os.path.join(deepest, "leaf.txt"))
+            for _ in range(depth):
+                os.rmdir(deepest)
+                deepest = os.path.dirname(deepest)
+
+        self.assertEqual(len(lines), depth + 2)
+        self.assertEqual(lines[-1], "   " * (depth + 1) + "┗ 📜 leaf.txt")
+
+    def test_matches_recursive_renderer(self) -> None:
+        """Test that the iterative renderer draws the same tree as the recursive one."""
+        self.make_tree(
+            "b/x/deep.txt", "b/x/Deep2.txt", "b/empty/", "B.txt", "a.txt",
+            "c/.hidden/inner.txt", "c/visible.txt", "Z/y/z/leaf", ".dotfile"
+        )
+
+        self.assertEqual(render(self.root), render_recursive(self.root))
+
+    def test_parallel_listing_matches_serial_output(self) -> None:
+        """Test that prefetching on a thread pool keeps the tree order."""
+        for group in range(5):
+            for item in range(4):
+                self.make_tree(f"group{group}/dir{item}/file{item}.txt", f"group{group}/note.txt")
+
+        expected: List[str] = render(self.root)
+
+        with PrefetchingLister(workers=4, max_pending=3) as lister:
+            self.assertEqual(render(self.root, list_directory=lister), expected)
+
+    def test_parallel_listing_on_slow_filesystem(self) -> None:
+        """Test the speedup on an artificially slowed filesystem stand-in."""
+        for group in range(8):
+            for item in range(4):
+                self.make_tree(f"group{group}/dir{item}/file.txt")
+
+        latency: float = 0.02
+
+        def slow_read_directory(directory: str) -> List[os.DirEntry]:
+            time.sleep(latency)
+            return read_directory(directory)
+
+        started: float = time.perf_counter()
+        expected: List[str] = render(self.root, list_directory=slow_read_directory)
+        serial_time: float = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with PrefetchingLister(workers=16, list_directory=slow_read_directory) as lister:
+            lines: List[str] = render(self.root, list_directory=lister)
+        parallel_time: float = time.perf_counter() - started
+
+        self.assertEqual(lines, expected)
+        # 41 directories are listed: at least 0.8 s serially, about four round trips in parallel
+        self.assertGreater(serial_time, 41 * latency)
+        self.assertLess(parallel_time, serial_time / 3)
+
+    def test_listing_errors_are_rendered(self) -> None:
+        """Test that listing errors become output lines instead of aborting the walk."""
+        self.make_tree("broken/", "ok/file.txt")
+
+        def failing_read_directory(directory: str) -> List[os.DirEntry]:
+            if directory.endswith("broken"):
+                raise PermissionError("denied")
+            return read_directory(directory)
+
+        lines: List[str] = render(self.root, list_directory=failing_read_directory)
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ 📂 broken",
+            f"Permission denied: {self.root / 'broken'}",
+            "   ┗ 📂 ok",
+            "      ┗ 📜 file.txt",
+        ])
+
+    def render_filtered(self, **options) -> List[str]:
+        """Render the root with a TreeFilter built from the options."""
+        tree_filter: TreeFilter = TreeFilter(self.root, **options)
+        return render(self.root, list_directory=partial(read_directory, tree_filter=tree_filter))
+
+    def test_max_depth_prunes_listing(self) -> None:
+        """Test that directories below the depth limit are shown but never listed."""
+        self.make_tree("a/b/c/file.txt", "top.txt")
+
+        with mock.patch("directory_visualizer.os.scandir", wraps=os.scandir) as scandir:
+            lines: List[str] = self.render_filtered(max_depth=2)
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ 📂 a",
+            "   ┃  ┗ 📂 b",
+            "   ┗ 📜 top.txt",
+        ])
+        listed: List[str] = [os.fspath(call.args[0]) for call in scandir.call_args_list]
+        self.assertEqual(listed, [str(self.root), str(self.root / "a")])
+
+    def test_max_entries_per_dir(self) -> None:
+        """Test collapsing of entries beyond the per-directory limit."""
+        self.make_tree("dir/", "a.txt", "b.txt", "c.txt", "d.txt")
+
+        self.assertEqual(self.render_filtered(max_entries=2), [
+            "┗ 📂 root",
+            "   ┣ 📂 dir",
+            "   ┣ 📜 a.txt",
+            "   ┗ … 3 more",
+        ])
+
+        # The placeholder also passes through the prefetching lister
+        list_directory = partial(read_directory, tree_filter=TreeFilter(self.root, max_entries=2))
+        with PrefetchingLister(2, list_directory) as lister:
+            self.assertEqual(render(self.root, list_directory=lister), self.render_filtered(max_entries=2))
+
+    def test_negative_limits_are_rejected(self) -> None:
+        """Test that counts and limits must not be negative and workers must be positive."""
+        parser = setup_argument_parser()
+        for options in (["-n", "-1"], ["-L", "-1"], ["-t", "-3"], ["-w", "0"], ["-n", "many"]):
+            with self.assertRaises(SystemExit), mock.patch("sys.stderr", io.StringIO()):
+                parser.parse_args(["."] + options)
+
+        args = parser.parse_args([".", "-n", "0", "-L", "0", "-w", "2"])
+        self.assertEqual((args.max_entries_per_dir, args.max_depth, args.workers), (0, 0, 2))
+
+    def test_include_and_exclude_globs(self) -> None:
+        """Test include globs for files and exclude globs for any entry."""
+        self.make_tree("src/main.py", "src/notes.txt", "build/out.py", "setup.py", "README.md")
+
+        with mock.patch("directory_visualizer.os.scandir", wraps=os.scandir) as scandir:
+            lines: List[str] = self.render_filtered(include=["*.py"], exclude=["build", "src/main.*"])
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ 📂 src",
+            "   ┗ 📜 setup.py",
+        ])
+        listed: List[str] = [os.fspath(call.args[0]) for call in scandir.call_args_list]
+        self.assertNotIn(str(self.root / "build"), listed)
+
+    def test_gitignore_rules(self) -> None:
+        """Test that nested .gitignore files prune the traversal."""
+        self.make_tree(
+            "app.py", "app.pyc", "logs/today.log", "keep/important.pyc",
+            "keep/sub/data.tmp", "docs/guide.md", "docs/draft.md"
+        )
+        (self.root / ".gitignore").write_text("*.pyc\nlogs/\n/docs/draft.md\n*.tmp\n")
+        (self.root / "keep" / ".gitignore").write_text("!important.pyc\n")
+
+        with mock.patch("directory_visualizer.os.scandir", wraps=os.scandir) as scandir:
+            lines: List[str] = self.render_filtered(gitignore=True)
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ 📂 docs",
+            "   ┃  ┗ 📜 guide.md",
+            "   ┣ 📂 keep",
+            "   ┃  ┣ 📂 sub",
+            "   ┃  ┗ 📜 important.pyc",
+            "   ┗ 📜 app.py",
+        ])
+        listed: List[str] = [os.fspath(call.args[0]) for call in scandir.call_args_list]
+        self.assertNotIn(str(self.root / "logs"), listed)
+
+    def test_filters_below_root_with_trailing_separator(self) -> None:
+        """Test path globs and .gitignore rules under a root such as "/"."""
+        self.make_tree("src/main.py", "src/notes.txt", "setup.py")
+        tree_filter: TreeFilter = TreeFilter(str(self.root) + os.sep, exclude=["src/main.*"])
+
+        lines: List[str] = render(self.root, list_directory=partial(read_directory, tree_filter=tree_filter))
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ 📂 src",
+            "   ┃  ┗ 📜 notes.txt",
+            "   ┗ 📜 setup.py",
+        ])
+        rules: IgnoreRules = IgnoreRules.from_lines(os.sep, ["/usr/bin/"])
+        self.assertTrue(rules.is_ignored(os.path.join(os.sep, "usr", "bin"), True))
+        self.assertFalse(rules.is_ignored(os.path.join(os.sep, "opt", "usr", "bin"), True))
+
+    def write_sized(self, sizes: dict) -> None:
+        """Create files of the given sizes under the root."""
+        for relative, size in sizes.items():
+            path: Path = self.root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x" * size)
+
+    def test_size_rollups(self) -> None:
+        """Test bottom-up aggregation of sizes and file counts."""
+        self.write_sized({"a/one.bin": 100, "a/b/two.bin": 200, "three.bin": 50})
+
+        root = build_tree(str(self.root), read_directory)
+
+        self.assertEqual((root.size, root.files), (350, 3))
+        a = root.children[0]
+        self.assertEqual((a.name, a.size, a.files), ("a", 300, 2))
+        self.assertEqual((a.children[0].name, a.children[0].size), ("b", 200))
+        self.assertEqual(format_size(300), "300 B")
+        self.assertEqual(format_size(1536), "1.5 KB")
+
+    def test_top_k_by_size(self) -> None:
+        """Test sorting by size and collapsing all but the largest entries."""
+        self.write_sized({"small/f.bin": 10, "big/f.bin": 1000, "mid.bin": 500, "tiny.bin": 1})
+
+        root = build_tree(str(self.root), read_directory, limit=2, sort_by_size=True)
+        lines: List[str] = [ANSI_PATTERN.sub("", line) for line in iter_node_lines(root)]
+
+        self.assertEqual(lines, [
+            "┗ 📂 root (1.5 KB, 4 files)",
+            "   ┣ 📂 big (1000 B, 1 file)",
+            "   ┃  ┗ 📜 f.bin (1000 B)",
+            "   ┣ 📜 mid.bin (500 B)",
+            "   ┗ … 2 more (11 B)",
+        ])
+
+    def test_size_totals_ignore_display_depth(self) -> None:
+        """Test that the display depth limit does not change the totals."""
+        self.write_sized({"a/b/c/deep.bin": 123})
+
+        root = build_tree(str(self.root), read_directory, max_depth=1)
+
+        self.assertEqual((root.size, root.files), (123, 1))
+        self.assertEqual(root.children[0].size, 123)
+        self.assertEqual(root.children[0].children, [])
+
+    def test_snapshot_incremental_rescan(self) -> None:
+        """Test that only directories with a changed mtime are listed again."""
+        self.write_sized({"a/one.bin": 1, "b/two.bin": 2, "b/c/three.bin": 3})
+        snapshot: str = os.path.join(self.temp_dir.name, "tree.snapshot")
+        listed: List[str] = []
+
+        def recording_read_directory(directory: str) -> List[os.DirEntry]:
+            listed.append(os.path.relpath(directory, self.root))
+            return read_directory(directory)
+
+        first = build_tree(str(self.root), recording_read_directory, track_mtimes=True)
+        save_snapshot(snapshot, first, "filters")
+        self.assertEqual(sorted(listed), [".", "a", "b", "b/c"])
+
+        self.assertIsNone(load_snapshot(snapshot, str(self.root), "other filters"))
+        previous = load_snapshot(snapshot, str(self.root), "filters")
+        self.assertEqual((previous.size, previous.files), (6, 3))
+
+        # Adding a file changes the mtime of b/c only
+        (self.root / "b" / "c" / "four.bin").write_bytes(b"xxxx")
+        listed.clear()
+        second = build_tree(str(self.root), recording_read_directory, previous=previous)
+
+        self.assertEqual(listed, ["b/c"])
+        self.assertEqual((second.size, second.files), (10, 4))
+        lines: List[str] = [ANSI_PATTERN.sub("", line) for line in iter_node_lines(second, show_sizes=False)]
+        self.assertEqual(lines, render(self.root))
+
+    def test_snapshot_rescan_prefetches_changed_directories_only(self) -> None:
+        """Test that unchanged directories reused from a snapshot are not listed ahead."""
+        self.write_sized({"a/one.bin": 1, "b/two.bin": 2, "b/c/three.bin": 3})
+        previous = build_tree(str(self.root), read_directory, track_mtimes=True)
+        listed: List[str] = []
+
+        def recording_read_directory(directory: str) -> List[os.DirEntry]:
+            listed.append(os.path.relpath(directory, self.root))
+            return read_directory(directory)
+
+        # The root and b/c change; a and b keep their listings
+        (self.root / "top.bin").write_bytes(b"x")
+        (self.root / "b" / "c" / "four.bin").write_bytes(b"xxxx")
+        prefetch = partial(needs_listing, index_directories(previous))
+        with PrefetchingLister(2, recording_read_directory, prefetch=prefetch) as lister:
+            second = build_tree(str(self.root), lister, previous=previous)
+            self.assertEqual(lister.pending, {})
+
+        self.assertEqual(sorted(listed), [".", "b/c"])
+        self.assertEqual((second.size, second.files), (11, 5))
+
+    def test_snapshot_run_does_not_list_unchanged_root(self) -> None:
+        """Test that a snapshot run lists nothing when nothing changed, and reports an unreadable root."""
+        self.make_tree("a/one.txt", "top.txt")
+        snapshot: str = os.path.join(self.temp_dir.name, "tree.snapshot")
+        argv: List[str] = ["directory_visualizer.py", str(self.root), "--snapshot", snapshot, "-f", "plain"]
+
+        outputs: List[str] = []
+        with mock.patch.object(sys, "argv", argv):
+            for _ in range(2):
+                with mock.patch("directory_visualizer.os.scandir", wraps=os.scandir) as scandir, \
+                        mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                    main()
+                outputs.append(stdout.getvalue())
+
+        self.assertEqual(scandir.call_count, 0)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertIn("a/one.txt", outputs[1])
+
+        # A changed root that cannot be listed fails like one listed up front
+        (self.root / "new.txt").touch()
+        with mock.patch.object(sys, "argv", argv), \
+                mock.patch("directory_visualizer.os.scandir", side_effect=PermissionError), \
+                mock.patch("sys.stderr", new_callable=io.StringIO) as stderr, \
+                self.assertRaises(SystemExit):
+            main()
+        self.assertIn(f"Permission denied: {self.root}", stderr.getvalue())
+
+    def test_snapshot_keeps_gitignore_rules(self) -> None:
+        """Test that .gitignore files of reused listings still apply to changed directories below them."""
+        self.make_tree("a/b/old.log", "a/b/keep.txt")
+        (self.root / "a" / ".gitignore").write_text("*.log\n")
+
+        def scan(previous=None):
+            # Every run starts with a new filter, like a new process would
+            tree_filter = TreeFilter(self.root, gitignore=True)
+            list_directory = partial(read_directory, tree_filter=tree_filter)
+            return build_tree(
+                str(self.root), list_directory, previous=previous, track_mtimes=True,
+                on_reuse=tree_filter.load_ignore_file
+            )
+
+        first = scan()
+        (self.root / "a" / "b" / "new.log").write_text("x")
+        second = scan(first)
+
+        b = second.children[0].children[0]
+        self.assertEqual([child.name for child in b.children], ["keep.txt"])
+
+    def test_snapshot_diff(self) -> None:
+        """Test that the diff keeps only added and removed entries with their parents."""
+        self.make_tree("keep/old.txt", "keep/same.txt", "gone/file.txt", "top.txt")
+        before = build_tree(str(self.root), read_directory)
+
+        (self.root / "keep" / "old.txt").unlink()
+        (self.root / "gone" / "file.txt").unlink()
+        (self.root / "gone").rmdir()
+        self.make_tree("keep/new.txt", "fresh/")
+        after = build_tree(str(self.root), read_directory)
+
+        diff = diff_trees(before, after)
+        lines: List[str] = [ANSI_PATTERN.sub("", line) for line in iter_node_lines(diff, show_sizes=False)]
+
+        self.assertEqual(lines, [
+            "┗ 📂 root",
+            "   ┣ + 📂 fresh",
+            "   ┣ - 📂 gone",
+            "   ┃  ┗ - 📜 file.txt",
+            "   ┗ 📂 keep",
+            "      ┣ + 📜 new.txt",
+            "      ┗ - 📜 old.txt",
+        ])
+
+    def test_streaming_json_formats(self) -> None:
+        """Test the JSON, NDJSON and plain output records."""
+        self.make_tree("sub/b.txt", "sub/c.txt", "sub/d.txt", "a.txt")
+        list_directory = partial(read_directory, tree_filter=TreeFilter(self.root, max_entries=2))
+        records = list(iter_tree_records(self.root, list_directory))
+
+        self.assertEqual(records, [
+            {"path": ".", "name": "root", "type": "dir", "depth": 0},
+            {"path": "sub", "name": "sub", "type": "dir", "depth": 1},
+            {"path": "sub/b.txt", "name": "b.txt", "type": "file", "depth": 2},
+            {"path": "sub/c.txt", "name": "c.txt", "type": "file", "depth": 2},
+            {"path": "sub", "name": "… 1 more", "type": "more", "depth": 2, "count": 1},
+            {"path": "a.txt", "name": "a.txt", "type": "file", "depth": 1},
+        ])
+
+        output = io.StringIO()
+        write_lines(iter_record_lines(iter(records), "json"), output)
+        self.assertEqual(json.loads(output.getvalue()), records)
+
+        lines: List[str] = list(iter_record_lines(iter(records), "ndjson"))
+        self.assertEqual([json.loads(line) for line in lines], records)
+        self.assertNotIn("\x1b", "".join(lines))
+
+        self.assertEqual(
+            list(iter_record_lines(iter(records), "plain")),
+            ["./", "sub/", "sub/b.txt", "sub/c.txt", "sub/… 1 more", "a.txt"]
+        )
+
+        link = {"path": "sub/up", "name": "up", "type": "link", "depth": 2, "target": ".."}
+        more = {"path": ".", "name": "… 2 more", "type": "more", "depth": 1, "count": 2}
+        self.assertEqual(list(iter_record_lines(iter([link, more]), "plain")), ["sub/up", "… 2 more"])
+
+    def test_record_paths_below_root_with_trailing_separator(self) -> None:
+        """Test that record paths stay whole when the root ends in a separator, as "/" does."""
+        self.make_tree("sub/b.txt", "a.txt")
+        root: str = str(self.root) + os.sep
+
+        streamed = [record["path"] for record in iter_tree_records(root)]
+        scanned = [record["path"] for record in iter_node_records(build_tree(root, read_directory))]
+        self.assertEqual(streamed, [".", "sub", "sub/b.txt", "a.txt"])
+        self.assertEqual(scanned, streamed)
+
+        self.assertEqual(relative_path(os.sep, os.sep + "bin"), "bin")
+        self.assertEqual(relative_path(os.sep, os.sep), ".")
+
+    def test_node_records_include_sizes(self) -> None:
+        """Test records of a scanned tree carry sizes and collapsed entries."""
+        self.write_sized({"big.bin": 30, "mid.bin": 20, "small.bin": 10})
+        root = build_tree(str(self.root), read_directory, limit=1, sort_by_size=True)
+
+        self.assertEqual(list(iter_node_records(root)), [
+            {"path": ".", "name": "root", "type": "dir", "depth": 0, "size": 60, "files": 3},
+            {"path": "big.bin", "name": "big.bin", "type": "file", "depth": 1, "size": 30, "files": 1},
+            {"path": ".", "name": "… 2 more", "type": "more", "depth": 1, "count": 2, "size": 30},
+        ])
+
+    def test_colors_only_for_terminals(self) -> None:
+        """Test that colour codes are dropped unless the output is a terminal."""
+        self.make_tree("a.txt")
+        try:
+            self.assertFalse(setup_color("auto", io.StringIO()))
+            self.assertEqual(list(iter_tree_lines(self.root)), ["┗ 📂 root", "   ┗ 📜 a.txt"])
+
+            self.assertTrue(setup_color("always", io.StringIO()))
+            self.assertIn("\x1b[32m", list(iter_tree_lines(self.root))[1])
+        finally:
+            setup_color("always")
+
+    def test_root_listing_is_reused(self) -> None:
+        """Test that the root listed up front is not listed again."""
+        self.make_tree("sub/a.txt", "b.txt")
+        entries = list_root_directory(self.root)
+
+        with mock.patch("directory_visualizer.os.scandir", wraps=os.scandir) as scandir:
+            with directory_lister(known_listing=(str(self.root), entries)) as list_directory:
+                lines: List[str] = render(self.root, list_directory=list_directory)
+
+        self.assertEqual(lines, ["┗ 📂 root", "   ┣ 📂 sub", "   ┃  ┗ 📜 a.txt", "   ┗ 📜 b.txt"])
+        self.assertEqual([call.args[0] for call in scandir.call_args_list], [os.path.join(self.root, "sub")])
+
+    def make_links(self) -> None:
+        """Create a tree with a symlink cycle, a symlinked directory and a hard link."""
+        self.make_tree("a/b/", "real/f.txt")
+        (self.root / "a" / "file").write_bytes(b"hello")
+        os.link(self.root / "a" / "file", self.root / "a" / "b" / "hard")
+        os.symlink(os.path.join("..", ".."), self.root / "a" / "b" / "loop")
+        os.symlink(os.path.join("..", "real"), self.root / "a" / "tolink")
+
+    @unittest.skipUnless(hasattr(os, "symlink") and os.name == "posix", "requires POSIX symlinks")
+    def test_symlinks_are_leaves(self) -> None:
+        """Test that symlinks are shown with their target and not followed."""
+        self.make_links()
+
+        self.assertEqual(render(self.root), [
+            "┗ 📂 root",
+            "   ┣ 📂 a",
+            "   ┃  ┣ 📂 b",
+            "   ┃  ┃  ┣ 🔗 loop -> ../..",
+            "   ┃  ┃  ┗ 📜 hard",
+            "   ┃  ┣ 🔗 tolink -> ../real",
+            "   ┃  ┗ 📜 file",
+            "   ┗ 📂 real",
+            "      ┗ 📜 f.txt",
+        ])
+
+    @unittest.skipUnless(hasattr(os, "symlink") and os.name == "posix", "requires POSIX symlinks")
+    def test_followed_symlinks_visit_directories_once(self) -> None:
+        """Test that followed symlink cycles end and hard links are counted once."""
+        self.make_links()
+        expected: List[str] = [
+            "┗ 📂 root",
+            "   ┣ 📂 a",
+            "   ┃  ┣ 📂 b",
+            "   ┃  ┃  ┣ 📂 loop (already shown)",
+            "   ┃  ┃  ┗ 📜 hard",
+            "   ┃  ┣ 📂 tolink",
+            "   ┃  ┃  ┗ 📜 f.txt",
+            "   ┃  ┗ 📜 file",
+            "   ┗ 📂 real (already shown)",
+        ]
+
+        self.assertEqual(render(self.root, follow_symlinks=True), expected)
+
+        root = build_tree(str(self.root), read_directory, follow_symlinks=True)
+        self.assertEqual((root.size, root.files), (5, 2))
+        lines: List[str] = [ANSI_PATTERN.sub("", line) for line in iter_node_lines(root, show_sizes=False)]
+        self.assertEqual(lines, expected)
+        # The second link keeps its size but adds nothing to its directory
+        lines = [ANSI_PATTERN.sub("", line) for line in iter_node_lines(root, show_sizes=True)]
+        self.assertIn("   ┃  ┗ 📜 file (5 B)", lines)
+        self.assertEqual((root.children[0].size, root.children[0].files), (5, 2))
+
+        snapshot: str = os.path.join(self.temp_dir.name, "tree.snapshot")
+        save_snapshot(snapshot, build_tree(str(self.root), read_directory, track_mtimes=True), "")
+        previous = load_snapshot(snapshot, str(self.root), "")
+        self.assertEqual(previous.children[0].children[1].target, os.path.join("..", "real"))
+        self.assertEqual((previous.size, previous.files), (5, 2))
+
+        # Reused listings are deduplicated again: the link counted first is gone now
+        (self.root / "a" / "b" / "hard").unlink()
+        rescanned = build_tree(str(self.root), read_directory, previous=previous)
+        self.assertEqual((rescanned.size, rescanned.files), (5, 2))
+        self.assertEqual([(child.name, child.size, child.counted) for child in rescanned.children[0].children[1:]], [
+            ("tolink", 0, True), ("file", 5, True)
+        ])
+
+    def test_watched_tree_updates_changed_subtree(self) -> None:
+        """Test that an update rescans only the changed directory and re-renders its subtree."""
+        self.write_sized({"a/b/one.bin": 1, "c/two.bin": 2})
+        listed: List[str] = []
+
+        def recording_read_directory(directory: str) -> List[os.DirEntry]:
+            listed.append(os.path.relpath(directory, self.root))
+            return read_directory(directory)
+
+        tree = WatchedTree(str(self.root), recording_read_directory)
+        renderer = SubtreeRenderer(show_sizes=True)
+        renderer.render(tree.root)
+        self.assertEqual(renderer.rendered, 4)
+
+        self.write_sized({"a/b/three.bin": 3, "a/d/four.bin": 4})
+        listed.clear()
+        changed, added, removed = tree.update({str(self.root / "a" / "b"), str(self.root / "a")})
+
+        self.assertEqual(sorted(listed), ["a", "a/b", "a/d"])
+        self.assertEqual(changed, {str(self.root), str(self.root / "a")})
+        self.assertEqual((added, removed), ({str(self.root / "a" / "d")}, set()))
+        self.assertEqual((tree.root.size, tree.root.files), (10, 4))
+
+        block = renderer.render(tree.root, changed)
+        # Only root, a, a/b and a/d are rendered again; c is reused
+        self.assertEqual(renderer.rendered, 4)
+        expected: List[str] = list(iter_node_lines(build_tree(str(self.root), read_directory)))
+        self.assertEqual(list(iter_block_lines(block)), expected)
+
+        (self.root / "c" / "two.bin").unlink()
+        (self.root / "c").rmdir()
+        changed, added, removed = tree.update({str(self.root), str(self.root / "c")})
+        self.assertEqual(removed, {str(self.root / "c")})
+        self.assertEqual((tree.root.size, tree.root.files), (8, 3))
+
+    def test_watched_tree_prefetches_changed_directories_only(self) -> None:
+        """Test that rescans do not list unchanged subdirectories ahead."""
+        self.write_sized({"a/b/one.bin": 1, "c/two.bin": 2})
+        listed: List[str] = []
+
+        def recording_read_directory(directory: str) -> List[os.DirEntry]:
+            listed.append(os.path.relpath(directory, self.root))
+            return read_directory(directory)
+
+        directories: dict = {}
+        prefetch = partial(needs_listing, directories)
+        with PrefetchingLister(2, recording_read_directory, prefetch=prefetch) as lister:
+            tree = WatchedTree(str(self.root), lister, directories=directories)
+            self.assertIs(directories, tree.directories)
+            self.assertIn(str(self.root / "a" / "b"), directories)
+            listed.clear()
+
+            self.write_sized({"new.bin": 4})
+            tree.update({str(self.root)})
+            self.assertEqual(lister.pending, {})
+
+        self.assertEqual(listed, ["."])
+        self.assertEqual((tree.root.size, tree.root.files), (7, 3))
+
+    def test_polling_watcher_and_debounce(self) -> None:
+        """Test mtime polling and the batching of changes that arrive in quick succession."""
+        self.make_tree("a/")
+        watcher = PollingWatcher(interval=0.01)
+        watcher.add(str(self.root / "a"))
+        self.assertEqual(watcher.wait(0.05), set())
+
+        # Make sure the modification time differs on coarse file systems
+        (self.root / "a" / "new.txt").touch()
+        os.utime(self.root / "a", ns=(0, 1))
+        self.assertEqual(watcher.wait(1), {str(self.root / "a")})
+
+        class QueuedWatcher(DirectoryWatcher):
+            def __init__(self, batches: List[set]) -> None:
+                self.batches = batches
+
+            def add(self, path: str) -> None:
+                pass
+
+            def remove(self, path: str) -> None:
+                pass
+
+            def wait(self, timeout=None) -> set:
+                return self.batches.pop(0) if self.batches else set()
+
+        queued = QueuedWatcher([{"x"}, {"y"}, {"x", "z"}, set(), {"later"}])
+        self.assertEqual(wait_for_changes(queued, debounce=0, max_delay=10), {"x", "y", "z"})
+        self.assertEqual(wait_for_changes(queued, debounce=0, max_delay=10), {"later"})
+
+        # Every watcher has to implement add, remove and wait
+        with self.assertRaises(TypeError):
+            DirectoryWatcher()
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "requires inotify")
+    def test_inotify_watcher_reports_changes(self) -> None:
+        """Test that inotify reports created files and writes, and stops after remove."""
+        self.make_tree("a/", "b/")
+        with InotifyWatcher(str(self.root)) as watcher:
+            watcher.add(str(self.root / "a"))
+            watcher.add(str(self.root / "b"))
+            self.assertEqual(watcher.wait(0.05), set())
+
+            (self.root / "a" / "new.txt").write_text("x")
+            self.assertEqual(watcher.wait(1), {str(self.root / "a")})
+
+            watcher.remove(str(self.root / "a"))
+            (self.root / "a" / "other.txt").touch()
+            (self.root / "b" / "file.txt").touch()
+            self.assertEqual(watcher.wait(1), {str(self.root / "b")})
+
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "requires inotify")
+    def test_inotify_watcher_symlinked_directories(self) -> None:
+        """Test that followed symlinks are watched through their target and others are refused."""
+        self.make_tree("target/")
+        (self.root / "link").symlink_to(self.root / "target")
+        link: str = str(self.root / "link")
+
+        with InotifyWatcher(str(self.root)) as watcher:
+            with self.assertRaises(OSError):
+                watcher.add(link)
+            # A directory removed before it is watched is left to its parent
+            watcher.add(str(self.root / "missing"))
+
+        with InotifyWatcher(str(self.root), follow_symlinks=True) as watcher:
+            watcher.add(link)
+            (self.root / "target" / "new.txt").touch()
+            self.assertEqual(watcher.wait(1), {link})
+
+if __name__ == "__main__":
+    unittest.main()
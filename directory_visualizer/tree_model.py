@@ -0,0 +1,462 @@
+"""
+In-memory directory tree model
+
+Builds a tree of TreeNode objects in a single depth-first pass and
+aggregates the total size and file count of every directory bottom-up
+from the stat results cached on each os.DirEntry. A directory is
+finished (and its children trimmed to what will be displayed) as soon
+as its whole subtree has been aggregated, so memory stays proportional
+to what is shown rather than to the size of the tree.
+
+Given an earlier scan, directories whose modification time is unchanged
+reuse their previous listing instead of being listed again.
+
+Symlinks are leaves unless symlinked directories are followed; either way
+every real directory is scanned once, and files with several hard links
+are counted once in the totals.
+"""
+
+import os
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+
+# Function returning the sorted visible entries of a directory path
+DirectoryLister = Callable[[str], List[os.DirEntry]]
+
+
+class TreeNode:
+    """
+    A file or directory in the tree model.
+    """
+
+    __slots__ = (
+        "name", "path", "is_dir", "size", "files", "children", "error",
+        "omitted", "omitted_size", "mtime", "status", "target", "repeat", "links", "counted"
+    )
+
+    def __init__(self, name: str, path: str, is_dir: bool, size: int = 0) -> None:
+        self.name: str = name
+        self.path: str = path
+        self.is_dir: bool = is_dir
+        # Total bytes and number of files of the subtree (the file itself for files)
+        self.size: int = size
+        self.files: int = 0 if is_dir else 1
+        self.children: List["TreeNode"] = []
+        self.error: Optional[str] = None
+        # Children collapsed by a display limit, still included in size and files
+        self.omitted: int = 0
+        self.omitted_size: int = 0
+        # Directory modification time in nanoseconds, recorded for snapshots
+        self.mtime: Optional[int] = None
+        # "added" or "removed" in a diff against an earlier snapshot
+        self.status: Optional[str] = None
+        # Target of a symlink shown as a leaf
+        self.target: Optional[str] = None
+        # Directory already scanned under another path (bind mount or followed symlink)
+        self.repeat: bool = False
+        # Number of hard links of a file
+        self.links: int = 1
+        # False for a hard link to a file counted before; it keeps its own size
+        # and file count but adds nothing to its directory
+        self.counted: bool = True
+
+
+class InodeSet:
+    """
+    Set of files identified by (st_dev, st_ino), each pair packed into one integer.
+    """
+
+    __slots__ = ("_keys",)
+
+    def __init__(self) -> None:
+        self._keys: Set[int] = set()
+
+    def add(self, stat_result: os.stat_result) -> bool:
+        """
+        Record a file.
+
+        Stat results without an inode number (os.DirEntry on Windows) are
+        never treated as seen.
+
+        Args:
+            stat_result (os.stat_result): Stat result of the file
+
+        Returns:
+            bool: False if the file was already recorded
+        """
+        if not stat_result.st_ino:
+            return True
+        key: int = (stat_result.st_dev << 64) | stat_result.st_ino
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def link_target(path: str) -> str:
+    """
+    Read the target of a symlink.
+
+    Args:
+        path (str): Symlink path
+
+    Returns:
+        str: Target as stored in the link, "?" if it cannot be read
+    """
+    try:
+        return os.readlink(path)
+    except OSError:
+        return "?"
+
+
+def relative_path(root: str, path: str) -> str:
+    """
+    Express a path below a root as a "/"-separated relative path.
+
+    Args:
+        root (str): Root directory, with or without a trailing separator (e.g. "/")
+        path (str): The root itself or a path joined onto it
+
+    Returns:
+        str: Path relative to the root, "." for the root itself
+    """
+    prefix: str = os.path.join(root, "")
+    if not path.startswith(prefix) or len(path) == len(prefix):
+        return "."
+    return path[len(prefix):].replace(os.sep, "/")
+
+
+def _count_hard_link(path: str, hard_links: InodeSet) -> bool:
+    # Reused listings carry no inode numbers, so files with several links are stat'ed again
+    try:
+        return hard_links.add(os.lstat(path))
+    except OSError:
+        return True
+
+
+def _is_leaf_link(entry: os.DirEntry, follow_symlinks: bool) -> bool:
+    # Symlinks are leaves unless they are followed into a directory
+    return entry.is_symlink() and not (follow_symlinks and entry.is_dir())
+
+
+def format_size(size: int) -> str:
+    """
+    Format a byte count with a binary unit.
+
+    Args:
+        size (int): Number of bytes
+
+    Returns:
+        str: Formatted size, e.g. "512 B" or "1.5 MB"
+    """
+    value: float = float(size)
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if value < 1024 or unit == "TB":
+            return f"{size} B" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+
+def _finish(
+    node: TreeNode,
+    depth: int,
+    max_depth: Optional[int],
+    limit: Optional[int],
+    sort_by_size: bool
+) -> None:
+    """
+    Trim the children of an aggregated directory to what will be displayed.
+
+    Args:
+        node (TreeNode): Directory whose subtree has been aggregated
+        depth (int): Depth of the directory (the root is 0)
+        max_depth (Optional[int]): Deepest level whose directories show their children
+        limit (Optional[int]): Maximum number of children shown per directory
+        sort_by_size (bool): Whether to order children by size, largest first
+    """
+    if max_depth is not None and depth >= max_depth:
+        node.children = []
+        return
+
+    if sort_by_size:
+        node.children.sort(key=lambda child: child.size, reverse=True)
+
+    if limit is not None and len(node.children) > limit:
+        collapsed: List[TreeNode] = node.children[limit:]
+        node.omitted = len(collapsed)
+        node.omitted_size = sum(child.size for child in collapsed if child.counted)
+        node.children = node.children[:limit]
+
+
+def trim_tree(
+    root: TreeNode,
+    max_depth: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort_by_size: bool = False
+) -> None:
+    """
+    Trim a complete tree to what will be displayed.
+
+    Args:
+        root (TreeNode): Root node of the tree
+        max_depth (Optional[int]): Deepest level whose directories keep their children
+        limit (Optional[int]): Maximum number of children kept per directory
+        sort_by_size (bool): Whether to order children by size, largest first
+    """
+    if max_depth is None and limit is None and not sort_by_size:
+        return
+
+    # Collect directories in pre-order, then finish them children first
+    order: List[Tuple[TreeNode, int]] = []
+    stack: List[Tuple[TreeNode, int]] = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        order.append((node, depth))
+        stack.extend((child, depth + 1) for child in node.children if child.is_dir)
+
+    for node, depth in reversed(order):
+        _finish(node, depth, max_depth, limit, sort_by_size)
+
+
+def build_tree(
+    root: str,
+    list_directory: DirectoryLister,
+    max_depth: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort_by_size: bool = False,
+    previous: Optional[TreeNode] = None,
+    track_mtimes: bool = False,
+    follow_symlinks: bool = False,
+    on_reuse: Optional[Callable[[str], None]] = None
+) -> TreeNode:
+    """
+    Scan a directory tree into TreeNode objects with aggregated sizes.
+
+    The whole tree is scanned so that totals are complete; max_depth and
+    limit only decide which nodes are kept for display.
+
+    With a previous scan of the same root, directories whose modification
+    time has not changed are not listed again: their cached entries are
+    reused and only their subdirectories are checked with one stat each.
+    File sizes of reused listings come from the previous scan, and on_reuse
+    is called with each reused directory before anything below it is listed.
+
+    Symlinks are kept as leaves with their target unless follow_symlinks is
+    set, in which case symlinked directories are scanned like directories.
+    A directory reached a second time (through a bind mount or a followed
+    symlink) is kept as an empty node marked as a repeat, so cycles end
+    and nothing is counted twice. Files with several hard links add to
+    their directory only the first time they are seen, including in reused
+    listings, while every link keeps its own size for display.
+
+    Args:
+        root (str): Root directory
+        list_directory (DirectoryLister): Function listing each directory
+        max_depth (Optional[int]): Deepest level whose directories keep their children
+        limit (Optional[int]): Maximum number of children kept per directory
+        sort_by_size (bool): Whether to order children by size, largest first
+        previous (Optional[TreeNode]): Complete earlier scan of the same root
+        track_mtimes (bool): Whether to record directory modification times
+        follow_symlinks (bool): Whether to scan symlinked directories
+        on_reuse (Optional[Callable[[str], None]]): Called with every directory
+            whose previous listing is reused
+
+    Returns:
+        TreeNode: Root node of the scanned tree
+    """
+    track_mtimes = track_mtimes or previous is not None
+    root_node: TreeNode = TreeNode(os.path.basename(root) or root, root, True)
+    visited: InodeSet = InodeSet()
+    hard_links: InodeSet = InodeSet()
+
+    root_stat: Optional[os.stat_result] = _stat_directory(root_node)
+    if root_stat is not None:
+        visited.add(root_stat)
+        if track_mtimes:
+            root_node.mtime = root_stat.st_mtime_ns
+
+    # Each frame: (directory node, iterator over its entries, previous subdirectories by name)
+    stack: List[Tuple[TreeNode, Iterator[Union[os.DirEntry, TreeNode]], Dict[str, TreeNode]]] = [
+        _open_frame(root_node, previous, list_directory, on_reuse)
+    ]
+
+    while stack:
+        node, entries, previous_dirs = stack[-1]
+
+        for entry in entries:
+            if isinstance(entry, TreeNode):
+                # Entry of a reused listing
+                if entry.is_dir:
+                    child: TreeNode = TreeNode(entry.name, entry.path, True)
+                    node.children.append(child)
+                    stat_result: Optional[os.stat_result] = _stat_directory(child)
+                    if stat_result is not None and not visited.add(stat_result):
+                        child.repeat = True
+                        continue
+                    child.mtime = stat_result.st_mtime_ns if stat_result is not None else None
+                    stack.append(_open_frame(child, entry, list_directory, on_reuse))
+                    break
+                child = TreeNode(entry.name, entry.path, False, entry.size)
+                child.files = entry.files
+                child.error = entry.error
+                child.target = entry.target
+                if entry.links > 1:
+                    child.links = entry.links
+                    child.counted = _count_hard_link(child.path, hard_links)
+            else:
+                try:
+                    if _is_leaf_link(entry, follow_symlinks):
+                        child = TreeNode(entry.name, entry.path, False)
+                        child.files = 0
+                        child.target = link_target(entry.path)
+                    elif entry.is_dir():
+                        stat_result = entry.stat()
+                        child = TreeNode(entry.name, entry.path, True)
+                        node.children.append(child)
+                        if not visited.add(stat_result):
+                            child.repeat = True
+                            continue
+                        if track_mtimes:
+                            child.mtime = stat_result.st_mtime_ns
+                        stack.append(_open_frame(child, previous_dirs.get(entry.name), list_directory, on_reuse))
+                        break
+                    else:
+                        stat_result = entry.stat(follow_symlinks=False)
+                        child = TreeNode(entry.name, entry.path, False, stat_result.st_size)
+                        if stat_result.st_nlink > 1:
+                            child.links = stat_result.st_nlink
+                            child.counted = hard_links.add(stat_result)
+                except OSError as e:
+                    child = TreeNode(entry.name, entry.path, False)
+                    child.files = 0
+                    child.error = str(e)
+            node.children.append(child)
+            if child.counted:
+                node.size += child.size
+                node.files += child.files
+        else:
+            stack.pop()
+            _finish(node, len(stack), max_depth, limit, sort_by_size)
+            if stack:
+                parent: TreeNode = stack[-1][0]
+                parent.size += node.size
+                parent.files += node.files
+
+    return root_node
+
+
+def index_directories(root: TreeNode) -> Dict[str, TreeNode]:
+    """
+    Index the scanned directories of a tree by path.
+
+    Args:
+        root (TreeNode): Root node of the tree
+
+    Returns:
+        Dict[str, TreeNode]: Every directory node that is not a repeat, by path
+    """
+    directories: Dict[str, TreeNode] = {}
+    stack: List[TreeNode] = [root]
+    while stack:
+        node: TreeNode = stack.pop()
+        if not node.repeat:
+            directories[node.path] = node
+        stack.extend(child for child in node.children if child.is_dir)
+    return directories
+
+
+def needs_listing(directories: Dict[str, TreeNode], entry: os.DirEntry) -> bool:
+    """
+    Check whether build_tree will list a subdirectory instead of reusing its previous listing.
+
+    Meant as a prefetch predicate, so that listings that would be
+    thrown away are not made ahead of time. The stat result is cached on
+    the entry, so build_tree does not stat the directory again.
+
+    Args:
+        directories (Dict[str, TreeNode]): Directories of the previous scan by path
+        entry (os.DirEntry): Subdirectory entry
+
+    Returns:
+        bool: False if the directory is unchanged since the previous scan or cannot be read
+    """
+    previous: Optional[TreeNode] = directories.get(entry.path)
+    if previous is None or previous.mtime is None or previous.error is not None:
+        return True
+    try:
+        return entry.stat().st_mtime_ns != previous.mtime
+    except OSError:
+        return False
+
+
+def _stat_directory(node: TreeNode) -> Optional[os.stat_result]:
+    """
+    Stat a directory, recording errors on its node.
+
+    Args:
+        node (TreeNode): Directory node
+
+    Returns:
+        Optional[os.stat_result]: Stat result, None on error
+    """
+    try:
+        return os.stat(node.path)
+    except OSError as e:
+        node.error = f"Error reading directory {node.path}: {e}"
+        return None
+
+
+def _open_frame(
+    node: TreeNode,
+    previous: Optional[TreeNode],
+    list_directory: DirectoryLister,
+    on_reuse: Optional[Callable[[str], None]] = None
+) -> Tuple[TreeNode, Iterator[Union[os.DirEntry, TreeNode]], Dict[str, TreeNode]]:
+    """
+    Start the traversal of a directory, reusing its previous listing when unchanged.
+
+    Args:
+        node (TreeNode): Directory node
+        previous (Optional[TreeNode]): The same directory in the previous scan
+        list_directory (DirectoryLister): Function listing the directory
+        on_reuse (Optional[Callable[[str], None]]): Called with the directory if its listing is reused
+
+    Returns:
+        Tuple: Traversal frame (node, entries, previous subdirectories by name)
+    """
+    if node.error:
+        return node, iter(()), {}
+
+    if previous is None:
+        return node, iter(_list_into(node, list_directory)), {}
+
+    if node.mtime is not None and node.mtime == previous.mtime and previous.error is None:
+        if on_reuse is not None:
+            on_reuse(node.path)
+        return node, iter(previous.children), {}
+
+    previous_dirs: Dict[str, TreeNode] = {child.name: child for child in previous.children if child.is_dir}
+    return node, iter(_list_into(node, list_directory)), previous_dirs
+
+
+def _list_into(node: TreeNode, list_directory: DirectoryLister) -> List[os.DirEntry]:
+    """
+    List a directory, recording a listing error on its node.
+
+    Args:
+        node (TreeNode): Directory node
+        list_directory (DirectoryLister): Function listing the directory
+
+    Returns:
+        List[os.DirEntry]: Directory entries, empty on error
+    """
+    try:
+        return list_directory(node.path)
+    except PermissionError:
+        node.error = f"Permission denied: {node.path}"
+    except OSError as e:
+        node.error = f"Error reading directory {node.path}: {e}"
+    return []
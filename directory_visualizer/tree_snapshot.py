@@ -0,0 +1,222 @@
+"""
+Persistent tree snapshots
+
+Saves a scanned tree as a compact gzip-compressed JSON file: one flat
+record per entry in depth-first order holding its depth, name, type,
+size and the modification time of a directory, the target of a symlink
+or the hard link count of a file with several links. Loading rebuilds the
+TreeNode tree, which build_tree() then uses to skip listing directories
+whose modification time has not changed. diff_trees() compares two
+scans and keeps only the entries that were added or removed.
+"""
+
+import os
+import gzip
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from tree_model import TreeNode
+
+
+SNAPSHOT_VERSION: int = 3
+
+# Entry types stored in snapshot records
+FILE_RECORD: int = 0
+DIRECTORY_RECORD: int = 1
+LINK_RECORD: int = 2
+
+
+def save_snapshot(path: str, root: TreeNode, signature: str) -> None:
+    """
+    Write a complete scan to a snapshot file.
+
+    Entries with errors and repeated directories are stored without their
+    listing, so they are listed again on the next run.
+
+    Args:
+        path (str): Snapshot file path
+        root (TreeNode): Root node of a complete scan
+        signature (str): Description of the filters the scan was made with
+    """
+    records: List[List[Any]] = []
+    stack: List[Tuple[TreeNode, int]] = [(root, 0)]
+
+    while stack:
+        node, depth = stack.pop()
+        if node.is_dir:
+            mtime: Optional[int] = None if node.error or node.repeat else node.mtime
+            records.append([depth, node.name, DIRECTORY_RECORD, node.size, mtime])
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+        elif node.target is not None:
+            records.append([depth, node.name, LINK_RECORD, node.size, node.target])
+        elif node.links > 1:
+            records.append([depth, node.name, FILE_RECORD, node.size, node.links, node.counted])
+        elif node.error is None:
+            records.append([depth, node.name, FILE_RECORD, node.size])
+
+    document: Dict[str, Any] = {
+        "version": SNAPSHOT_VERSION,
+        "root": root.path,
+        "signature": signature,
+        "entries": records,
+    }
+
+    temp_path: str = f"{path}.tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as file:
+        json.dump(document, file, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path: str, root: str, signature: str) -> Optional[TreeNode]:
+    """
+    Load a snapshot of the same root made with the same filters.
+
+    Args:
+        path (str): Snapshot file path
+        root (str): Root directory the snapshot must belong to
+        signature (str): Description of the current filters
+
+    Returns:
+        Optional[TreeNode]: Root node of the snapshot, None if it is missing,
+        unreadable or was made for another root or other filters
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            document: Dict[str, Any] = json.load(file)
+    except (OSError, ValueError, EOFError):
+        return None
+
+    if (
+        document.get("version") != SNAPSHOT_VERSION
+        or document.get("root") != root
+        or document.get("signature") != signature
+        or not document.get("entries")
+    ):
+        return None
+
+    _, name, _, size, mtime = document["entries"][0]
+    root_node: TreeNode = TreeNode(name, root, True, size)
+    root_node.mtime = mtime
+    # Directory nodes on the path to the current record, indexed by depth
+    parents: List[TreeNode] = [root_node]
+
+    for record in document["entries"][1:]:
+        depth: int = record[0]
+        parent: TreeNode = parents[depth - 1]
+        node: TreeNode = TreeNode(
+            record[1], os.path.join(parent.path, record[1]), record[2] == DIRECTORY_RECORD, record[3]
+        )
+        parent.children.append(node)
+        if record[2] == LINK_RECORD:
+            node.files = 0
+            node.target = record[4]
+        elif record[2] == FILE_RECORD and len(record) > 4:
+            node.links, node.counted = record[4], record[5]
+        elif node.is_dir:
+            node.mtime = record[4]
+            del parents[depth:]
+            parents.append(node)
+
+    # Directory file counts are not stored; restore them bottom-up
+    _count_files(root_node)
+    return root_node
+
+
+def _count_files(root: TreeNode) -> None:
+    """
+    Recompute the file counts of all directories.
+
+    Args:
+        root (TreeNode): Root node of the tree
+    """
+    order: List[TreeNode] = []
+    stack: List[TreeNode] = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in node.children if child.is_dir)
+
+    for node in reversed(order):
+        node.files = sum(child.files for child in node.children if child.counted)
+
+
+def _sort_key(node: TreeNode) -> Tuple[bool, str]:
+    # Same order as read_directory: directories first, then by name
+    return not node.is_dir, node.name.lower()
+
+
+def _mark(node: TreeNode, status: str) -> TreeNode:
+    """
+    Mark a node and its whole subtree as added or removed.
+
+    Args:
+        node (TreeNode): Subtree root
+        status (str): "added" or "removed"
+
+    Returns:
+        TreeNode: The same node
+    """
+    stack: List[TreeNode] = [node]
+    while stack:
+        current: TreeNode = stack.pop()
+        current.status = status
+        stack.extend(current.children)
+    return node
+
+
+def diff_trees(old: TreeNode, new: TreeNode) -> TreeNode:
+    """
+    Build a tree of the entries added or removed between two scans.
+
+    Unchanged entries are dropped; directories are kept when something
+    inside them changed, so every change is shown with its path.
+
+    Args:
+        old (TreeNode): Root node of the earlier scan
+        new (TreeNode): Root node of the current scan
+
+    Returns:
+        TreeNode: Root of the diff tree, with status set on changed entries
+    """
+    result: TreeNode = TreeNode(new.name, new.path, True, new.size)
+    result.files = new.files
+    result.error = new.error
+
+    # Each frame: (old directory, new directory, diff directory, link to its parent frame)
+    # where a link is (parent diff directory, link of the parent) and None for the root
+    Link = Optional[Tuple[TreeNode, Any]]
+    stack: List[Tuple[TreeNode, TreeNode, TreeNode, Link]] = [(old, new, result, None)]
+    attached: Set[int] = {id(result)}
+
+    while stack:
+        old_dir, new_dir, diff_dir, link = stack.pop()
+        old_children: Dict[Tuple[str, bool], TreeNode] = {
+            (child.name, child.is_dir): child for child in old_dir.children
+        }
+        changed: List[TreeNode] = []
+
+        for child in new_dir.children:
+            previous: Optional[TreeNode] = old_children.pop((child.name, child.is_dir), None)
+            if previous is None:
+                changed.append(_mark(child, "added"))
+            elif child.is_dir:
+                diff_child: TreeNode = TreeNode(child.name, child.path, True, child.size)
+                diff_child.files = child.files
+                diff_child.error = child.error
+                stack.append((previous, child, diff_child, (diff_dir, link)))
+
+        changed.extend(_mark(child, "removed") for child in old_children.values())
+
+        if changed:
+            diff_dir.children.extend(changed)
+            diff_dir.children.sort(key=_sort_key)
+            # Attach the directory and any unattached ancestors to their parents
+            node: TreeNode = diff_dir
+            while id(node) not in attached and link is not None:
+                parent, link = link
+                parent.children.append(node)
+                parent.children.sort(key=_sort_key)
+                attached.add(id(node))
+                node = parent
+
+    return result
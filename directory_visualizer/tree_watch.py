@@ -0,0 +1,427 @@
+"""
+Watching a scanned tree for changes
+
+Keeps a TreeNode model up to date with the file system. A watcher reports
+which directories changed, using inotify on Linux (through ctypes, no extra
+dependency) and falling back to polling directory modification times
+elsewhere. Changes are debounced, and each changed directory is scanned
+again with the previous scan, so unchanged subdirectories are reused and
+only the affected part of the model is replaced.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tree_model import DirectoryLister, TreeNode, build_tree, index_directories
+
+
+# Seconds without further changes before a batch of changes is applied
+WATCH_DEBOUNCE: float = 0.2
+
+# Longest time changes are held back while they keep arriving
+WATCH_MAX_DELAY: float = 2.0
+
+# Seconds between two scans of the directory modification times when polling
+POLL_INTERVAL: float = 1.0
+
+# inotify(7) constants
+IN_MODIFY: int = 0x00000002
+IN_ATTRIB: int = 0x00000004
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_DELETE: int = 0x00000200
+IN_DELETE_SELF: int = 0x00000400
+IN_MOVE_SELF: int = 0x00000800
+IN_Q_OVERFLOW: int = 0x00004000
+IN_IGNORED: int = 0x00008000
+IN_ONLYDIR: int = 0x01000000
+IN_DONT_FOLLOW: int = 0x02000000
+IN_NONBLOCK: int = 0o4000
+IN_CLOEXEC: int = 0o2000000
+
+WATCH_MASK: int = (
+    IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW
+)
+
+# struct inotify_event without the trailing name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class DirectoryWatcher(ABC):
+    """
+    Reports directories whose contents changed.
+    """
+
+    @abstractmethod
+    def add(self, path: str) -> None:
+        """
+        Start watching a directory.
+
+        Args:
+            path (str): Directory path
+        """
+
+    @abstractmethod
+    def remove(self, path: str) -> None:
+        """
+        Stop watching a directory.
+
+        Args:
+            path (str): Directory path
+        """
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Wait for changes.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, None to wait for the first change
+
+        Returns:
+            Set[str]: Directories that changed, empty if the timeout expired
+        """
+
+    def close(self) -> None:
+        """Release the resources of the watcher."""
+
+    def __enter__(self) -> "DirectoryWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class PollingWatcher(DirectoryWatcher):
+    """
+    Watcher comparing directory modification times at a fixed interval.
+
+    Works on every platform and file system, but only notices entries
+    being added, removed or renamed: writing to a file does not change
+    the modification time of its directory.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL) -> None:
+        self.interval: float = interval
+        self.mtimes: Dict[str, Optional[int]] = {}
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def add(self, path: str) -> None:
+        self.mtimes[path] = self._mtime(path)
+
+    def remove(self, path: str) -> None:
+        self.mtimes.pop(path, None)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        deadline: Optional[float] = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            delay: float = self.interval
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0.0))
+            time.sleep(delay)
+
+            changed: Set[str] = set()
+            for path, mtime in self.mtimes.items():
+                current: Optional[int] = self._mtime(path)
+                if current != mtime:
+                    self.mtimes[path] = current
+                    changed.add(path)
+
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+class InotifyWatcher(DirectoryWatcher):
+    """
+    Watcher using Linux inotify through the C library.
+
+    Every directory of the tree gets its own watch. Besides entries being
+    added, removed or renamed, writes to files are reported too, so file
+    sizes stay current.
+
+    Args:
+        root (str): Root directory of the tree
+        follow_symlinks (bool): Whether watched paths may be symlinks to directories
+
+    Raises:
+        OSError: If inotify is not available
+    """
+
+    def __init__(self, root: str, follow_symlinks: bool = False) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+
+        self.root: str = root
+        # Symlinked directories can only be watched through their target
+        self.mask: int = WATCH_MASK & ~IN_DONT_FOLLOW if follow_symlinks else WATCH_MASK
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd: int = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code: int = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+        self.paths: Dict[int, str] = {}
+        self.descriptors: Dict[str, int] = {}
+
+    def add(self, path: str) -> None:
+        """
+        Start watching a directory.
+
+        Args:
+            path (str): Directory path
+
+        Raises:
+            OSError: If the watch cannot be added, e.g. because the path is
+            not a directory or the limit of watches per user
+            (fs.inotify.max_user_watches) is reached
+        """
+        descriptor: int = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+        if descriptor < 0:
+            code: int = ctypes.get_errno()
+            if code == errno.ENOENT:
+                # Removed before it could be watched; its parent reports that
+                return
+            raise OSError(code, os.strerror(code), path)
+        self.paths[descriptor] = path
+        self.descriptors[path] = descriptor
+
+    def remove(self, path: str) -> None:
+        descriptor: Optional[int] = self.descriptors.pop(path, None)
+        if descriptor is not None and self.paths.get(descriptor) == path:
+            del self.paths[descriptor]
+            # Fails harmlessly if the kernel already dropped the watch
+            self.libc.inotify_rm_watch(self.fd, descriptor)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: Set[str] = set()
+        try:
+            data: bytes = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset: int = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            descriptor, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size + name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; everything has to be checked again
+                changed.add(self.root)
+                continue
+
+            path: Optional[str] = self.paths.get(descriptor)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(descriptor, None)
+                if self.descriptors.get(path) == descriptor:
+                    del self.descriptors[path]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # The parent directory reports the removal
+                continue
+            changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(
+    root: str,
+    directories: Iterable[str],
+    poll: bool = False,
+    interval: float = POLL_INTERVAL,
+    follow_symlinks: bool = False
+) -> DirectoryWatcher:
+    """
+    Create the best available watcher for a set of directories.
+
+    Args:
+        root (str): Root directory of the tree
+        directories (Iterable[str]): Directories to watch
+        poll (bool): Whether to poll even when inotify is available
+        interval (float): Seconds between two polls
+        follow_symlinks (bool): Whether the directories include symlinks to directories
+
+    Returns:
+        DirectoryWatcher: InotifyWatcher if it can watch every directory,
+        PollingWatcher otherwise
+    """
+    directories = list(directories)
+
+    if not poll:
+        try:
+            watcher: DirectoryWatcher = InotifyWatcher(root, follow_symlinks)
+        except (OSError, AttributeError):
+            # No inotify in this kernel or C library
+            pass
+        else:
+            try:
+                for path in directories:
+                    watcher.add(path)
+                return watcher
+            except OSError:
+                watcher.close()
+
+    watcher = PollingWatcher(interval)
+    for path in directories:
+        watcher.add(path)
+    return watcher
+
+
+def wait_for_changes(
+    watcher: DirectoryWatcher,
+    debounce: float = WATCH_DEBOUNCE,
+    max_delay: float = WATCH_MAX_DELAY
+) -> Set[str]:
+    """
+    Wait for a change and collect the changes that follow it in quick succession.
+
+    The batch ends when no change arrives for debounce seconds or at the
+    latest max_delay seconds after the first change, so a continuous
+    stream of writes still leads to regular updates.
+
+    Args:
+        watcher (DirectoryWatcher): Watcher to read changes from
+        debounce (float): Quiet period that ends a batch
+        max_delay (float): Longest time a batch is held back
+
+    Returns:
+        Set[str]: Directories that changed
+    """
+    changed: Set[str] = set()
+    while not changed:
+        changed = watcher.wait()
+
+    deadline: float = time.monotonic() + max_delay
+    while True:
+        remaining: float = deadline - time.monotonic()
+        if remaining <= 0:
+            return changed
+        more: Set[str] = watcher.wait(min(debounce, remaining))
+        if not more:
+            return changed
+        changed |= more
+
+
+class WatchedTree:
+    """
+    TreeNode model of a directory tree that is updated directory by directory.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        list_directory: DirectoryLister,
+        follow_symlinks: bool = False,
+        directories: Optional[Dict[str, TreeNode]] = None
+    ) -> None:
+        self.list_directory: DirectoryLister = list_directory
+        self.follow_symlinks: bool = follow_symlinks
+        self.root: TreeNode = build_tree(root, list_directory, track_mtimes=True, follow_symlinks=follow_symlinks)
+        # Every scanned directory of the model by path; a dict passed in (e.g. one
+        # shared with a prefetch predicate) is filled and kept up to date in place
+        self.directories: Dict[str, TreeNode] = directories if directories is not None else {}
+        self.directories.update(index_directories(self.root))
+
+    def update(self, changed: Iterable[str]) -> Tuple[Set[str], Set[str], Set[str]]:
+        """
+        Scan changed directories again and replace them in the model.
+
+        Each changed directory is listed again; its subdirectories are
+        reused from the model unless their modification time changed
+        too. Size and file totals of the ancestors are adjusted.
+
+        Args:
+            changed (Iterable[str]): Directories reported by a watcher
+
+        Returns:
+            Tuple[Set[str], Set[str], Set[str]]: Directories whose rendering
+            changed (the rescanned ones and their ancestors), directories
+            added to the model and directories removed from it
+        """
+        # Directories that changed must be listed again even if their mtime is the same
+        targets: List[str] = sorted(path for path in set(changed) if path in self.directories)
+        for path in targets:
+            self.directories[path].mtime = None
+
+        dirty: Set[str] = set()
+        added: Set[str] = set()
+        removed: Set[str] = set()
+        rescanned: List[str] = []
+
+        for path in sorted(targets, key=len):
+            # Parents come first; their rescan already covers changed subdirectories
+            if any(path.startswith(done + os.sep) for done in rescanned) or path not in self.directories:
+                continue
+            rescanned.append(path)
+
+            old: TreeNode = self.directories[path]
+            new: TreeNode = build_tree(path, self.list_directory, previous=old, follow_symlinks=self.follow_symlinks)
+            new.name = old.name
+            self._replace(old, new, dirty)
+
+            before: Dict[str, TreeNode] = index_directories(old)
+            after: Dict[str, TreeNode] = index_directories(new)
+            for gone in before.keys() - after.keys():
+                del self.directories[gone]
+                removed.add(gone)
+            for directory, node in after.items():
+                if directory not in before:
+                    added.add(directory)
+                self.directories[directory] = node
+
+        return dirty, added - removed, removed - added
+
+    def _replace(self, old: TreeNode, new: TreeNode, dirty: Set[str]) -> None:
+        """
+        Put a rescanned directory in place of its previous node and update the totals above it.
+
+        Args:
+            old (TreeNode): Previous node of the directory
+            new (TreeNode): Rescanned node of the same directory
+            dirty (Set[str]): Directories whose rendering changed, extended in place
+        """
+        dirty.add(new.path)
+        if old is self.root:
+            self.root = new
+            return
+
+        size_delta: int = new.size - old.size
+        files_delta: int = new.files - old.files
+        path: str = os.path.dirname(old.path)
+        parent: TreeNode = self.directories[path]
+        parent.children = [new if child is old else child for child in parent.children]
+
+        while True:
+            parent.size += size_delta
+            parent.files += files_delta
+            dirty.add(parent.path)
+            if parent is self.root:
+                return
+            parent = self.directories[os.path.dirname(parent.path)]
@@ -0,0 +1,3 @@
+"""
+Modules shared by the tools in this repository.
+"""
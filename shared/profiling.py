@@ -0,0 +1,384 @@
+"""
+Profiling hooks
+
+Named spans, counters and an optional cProfile run shared by all tools.
+Spans nest, so each stage is recorded under the stages that were open
+when it started, e.g. ("total_salary", "parse"). Nothing is recorded
+until a Profiler is enabled: span() then returns a shared no-op context
+manager and count() returns at once, so the hooks can stay in place
+around every stage. Spans are recorded for the main thread only.
+Callers that keep their own statistics use timer(), which measures the
+stage either way and records it as a span while profiling.
+
+Command line tools add the options with add_profile_arguments() and wrap
+their work in profile_session():
+    --profile                  print the time spent in each stage to stderr
+    --profile-stats PATH       also run under cProfile and write pstats data
+    --profile-collapsed PATH   write stage self times as collapsed stacks
+"""
+
+import sys
+import argparse
+import cProfile
+from contextlib import contextmanager
+from time import perf_counter_ns
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, TextIO, Tuple
+
+
+# Span names from the outermost open span to the recorded one
+SpanPath = Tuple[str, ...]
+
+
+class SpanStats:
+    """
+    Call count and times of one span path.
+    """
+
+    __slots__ = ("calls", "total_ns", "child_ns")
+
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.total_ns: int = 0
+        # Time spent in spans nested directly inside this one
+        self.child_ns: int = 0
+
+    @property
+    def self_ns(self) -> int:
+        return self.total_ns - self.child_ns
+
+
+class _NullSpan:
+    """
+    Context manager returned by span() while profiling is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+
+NULL_SPAN: _NullSpan = _NullSpan()
+
+
+class _Span:
+    """
+    Context manager timing one stage, recorded in a Profiler if there is one.
+    """
+
+    __slots__ = ("profiler", "name", "started", "elapsed_ns")
+
+    def __init__(self, profiler: Optional["Profiler"], name: str) -> None:
+        self.profiler: Optional[Profiler] = profiler
+        self.name: str = name
+        self.started: int = 0
+        # Duration of the stage, set when it ends
+        self.elapsed_ns: int = 0
+
+    def __enter__(self) -> "_Span":
+        if self.profiler is not None:
+            self.profiler._push(self.name)
+        self.started = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        self.elapsed_ns = perf_counter_ns() - self.started
+        if self.profiler is not None:
+            self.profiler._pop(self.elapsed_ns)
+        return False
+
+
+class Profiler:
+    """
+    Span timings and counters collected while profiling is enabled.
+    """
+
+    def __init__(self) -> None:
+        self.spans: Dict[SpanPath, SpanStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.started: int = perf_counter_ns()
+        self.finished: Optional[int] = None
+        self._stack: List[SpanPath] = [()]
+
+    def _push(self, name: str) -> None:
+        path: SpanPath = self._stack[-1] + (name,)
+        if path not in self.spans:
+            self.spans[path] = SpanStats()
+        self._stack.append(path)
+
+    def _pop(self, elapsed_ns: int) -> None:
+        path: SpanPath = self._stack.pop()
+        stats: SpanStats = self.spans[path]
+        stats.calls += 1
+        stats.total_ns += elapsed_ns
+        if len(path) > 1:
+            self.spans[path[:-1]].child_ns += elapsed_ns
+
+    def span(self, name: str) -> _Span:
+        """
+        Time a stage nested in the currently open span.
+
+        Args:
+            name (str): Stage name
+
+        Returns:
+            _Span: Context manager covering the stage
+        """
+        return _Span(self, name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Add to a named counter.
+
+        Args:
+            name (str): Counter name
+            value (int): Amount to add
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def wall_ns(self) -> int:
+        return (self.finished if self.finished is not None else perf_counter_ns()) - self.started
+
+    def ordered_spans(self) -> List[Tuple[SpanPath, SpanStats]]:
+        """
+        List the spans depth-first, each stage after the stage it is nested in.
+
+        Returns:
+            List[Tuple[SpanPath, SpanStats]]: Span paths and their statistics
+        """
+        # Siblings keep the order in which they were first entered
+        order: Dict[SpanPath, int] = {path: index for index, path in enumerate(self.spans)}
+        return sorted(
+            self.spans.items(),
+            key=lambda item: [order[item[0][:depth]] for depth in range(1, len(item[0]) + 1)]
+        )
+
+    def report(self) -> str:
+        """
+        Format the per-stage breakdown.
+
+        Returns:
+            str: Table of calls, total and self time and share of the wall time per stage,
+            followed by the counters
+        """
+        wall_ns: int = self.wall_ns
+        result: List[str] = [
+            f"Profile: {_format_ns(wall_ns)} wall time",
+            f"{'stage':<32}{'calls':>9}{'total':>12}{'self':>12}{'share':>8}",
+        ]
+        for path, stats in self.ordered_spans():
+            label: str = "  " * (len(path) - 1) + path[-1]
+            share: float = 100 * stats.total_ns / wall_ns if wall_ns else 0.0
+            result.append(
+                f"{label:<32}{stats.calls:>9}{_format_ns(stats.total_ns):>12}"
+                f"{_format_ns(stats.self_ns):>12}{share:>7.1f}%"
+            )
+
+        if self.counters:
+            result.append("Counters:")
+            result.extend(f"  {name:<30}{value:>9}" for name, value in self.counters.items())
+        return "\n".join(result)
+
+    def iter_collapsed(self) -> Iterator[str]:
+        """
+        Format the span self times as collapsed stacks.
+
+        Each line is "outer;inner value" with the self time in microseconds,
+        the input format of flamegraph.pl, speedscope and similar tools.
+
+        Yields:
+            str: One line per span with a non-zero self time
+        """
+        for path, stats in self.ordered_spans():
+            self_us: int = stats.self_ns // 1000
+            if self_us > 0:
+                yield f"{';'.join(path)} {self_us}"
+
+    def write_collapsed(self, path: str) -> None:
+        """
+        Write the collapsed stacks to a file.
+
+        Args:
+            path (str): Output file path
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for line in self.iter_collapsed():
+                file.write(line + "\n")
+
+
+def _format_ns(value_ns: int) -> str:
+    if value_ns < 1_000_000:
+        return f"{value_ns / 1_000:.1f} us"
+    if value_ns < 1_000_000_000:
+        return f"{value_ns / 1_000_000:.1f} ms"
+    return f"{value_ns / 1_000_000_000:.2f} s"
+
+
+# The enabled profiler, None while profiling is disabled
+_active: Optional[Profiler] = None
+
+
+def enable() -> Profiler:
+    """
+    Start recording into a new profiler.
+
+    Returns:
+        Profiler: The profiler now receiving spans and counters
+    """
+    global _active
+    _active = Profiler()
+    return _active
+
+
+def disable() -> Optional[Profiler]:
+    """
+    Stop recording.
+
+    Returns:
+        Optional[Profiler]: The profiler that was enabled, None if there was none
+    """
+    global _active
+    profiler: Optional[Profiler] = _active
+    _active = None
+    if profiler is not None:
+        profiler.finished = perf_counter_ns()
+    return profiler
+
+
+def active() -> Optional[Profiler]:
+    """
+    Return the enabled profiler, None while profiling is disabled.
+    """
+    return _active
+
+
+def span(name: str) -> ContextManager:
+    """
+    Time a stage when profiling is enabled.
+
+    Args:
+        name (str): Stage name
+
+    Returns:
+        ContextManager: Context manager covering the stage; a shared no-op while disabled
+    """
+    profiler: Optional[Profiler] = _active
+    if profiler is None:
+        return NULL_SPAN
+    return _Span(profiler, name)
+
+
+def timer(name: str) -> _Span:
+    """
+    Time a stage whether or not profiling is enabled.
+
+    Args:
+        name (str): Stage name, recorded as a span when profiling is enabled
+
+    Returns:
+        _Span: Context manager covering the stage, with its elapsed_ns set on exit
+    """
+    return _Span(_active, name)
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Add to a named counter when profiling is enabled.
+
+    Args:
+        name (str): Counter name
+        value (int): Amount to add
+    """
+    if _active is not None:
+        _active.count(name, value)
+
+
+def timed(name: str, func: Callable) -> Callable:
+    """
+    Wrap a function so that every call is recorded as a span.
+
+    The function is returned unchanged while profiling is disabled, so
+    wrapping costs nothing unless a profiler was enabled beforehand.
+
+    Args:
+        name (str): Stage name
+        func (Callable): Function to time
+
+    Returns:
+        Callable: Timed wrapper, or func itself while profiling is disabled
+    """
+    profiler: Optional[Profiler] = _active
+    if profiler is None:
+        return func
+
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with _Span(profiler, name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the profiling options to a command line parser.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser of the tool
+    """
+    group = parser.add_argument_group("profiling")
+    group.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time spent in each stage to stderr when done"
+    )
+    group.add_argument(
+        "--profile-stats",
+        metavar="PATH",
+        help="Also run under cProfile and write pstats data to PATH (implies --profile)"
+    )
+    group.add_argument(
+        "--profile-collapsed",
+        metavar="PATH",
+        help="Write stage self times as collapsed stacks for flame graphs to PATH (implies --profile)"
+    )
+
+
+@contextmanager
+def profile_session(options: argparse.Namespace, stream: Optional[TextIO] = None) -> Iterator[Optional[Profiler]]:
+    """
+    Profile the enclosed work as requested by the profiling options.
+
+    When the block exits, even with an exception, the breakdown is printed
+    and the requested files are written.
+
+    Args:
+        options (argparse.Namespace): Parsed options from add_profile_arguments()
+        stream (Optional[TextIO]): Stream for the breakdown, sys.stderr by default
+
+    Yields:
+        Optional[Profiler]: The enabled profiler, None if profiling was not requested
+    """
+    if not (options.profile or options.profile_stats or options.profile_collapsed):
+        yield None
+        return
+
+    profiler: Profiler = enable()
+    function_profiler: Optional[cProfile.Profile] = None
+    if options.profile_stats:
+        function_profiler = cProfile.Profile()
+        function_profiler.enable()
+
+    try:
+        yield profiler
+    finally:
+        if function_profiler is not None:
+            function_profiler.disable()
+            function_profiler.dump_stats(options.profile_stats)
+        disable()
+        print(profiler.report(), file=stream if stream is not None else sys.stderr)
+        if options.profile_collapsed:
+            profiler.write_collapsed(options.profile_collapsed)
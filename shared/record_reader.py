@@ -0,0 +1,613 @@
+"""
+Delimited record reader
+
+Reads text files of delimited records (one record per line, e.g.
+"name,salary") and validates them against a declarative schema. Blank
+lines are skipped, every field is stripped of surrounding whitespace, and
+the first invalid record raises a RecordError carrying the message from
+the schema.
+
+The encoding is detected once from the first bytes of the file: a BOM
+decides it, otherwise UTF-8 if the sample is valid UTF-8 and cp1251 if
+it is not. Files in ASCII-compatible encodings are read as bytes, split
+at newlines and decoded one newline-aligned block at a time, so no
+separate conversion pass is needed.
+
+Backends:
+    stream   - buffered reads of newline-aligned blocks; constant memory, lowest start-up cost
+    mmap     - memory-maps the file and decodes it in large newline-aligned blocks
+    parallel - splits the file into newline-aligned byte ranges parsed by a process pool;
+               only pays off for large files on multi-core machines
+
+Blocks are validated a column at a time (see RecordSchema.parse_block),
+and records are only assembled into tuples as the caller iterates.
+
+Files in other encodings (UTF-16 and UTF-32 with a BOM) are always read
+by the stream backend, in text mode.
+"""
+
+import os
+import mmap
+import codecs
+from functools import partial
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from shared.profiling import count, span
+
+
+# Bytes decoded at a time by the stream and mmap backends
+BLOCK_BYTES: int = 1024 * 1024
+
+# Bytes sampled from the start of a file to detect its encoding
+ENCODING_SAMPLE_BYTES: int = 64 * 1024
+
+# Encoding assumed for files that are not valid UTF-8 and have no BOM
+FALLBACK_ENCODING: str = "cp1251"
+
+# Byte order marks and the encodings they select; UTF-32 first, since its
+# little-endian BOM starts with the UTF-16 one
+BOMS: Tuple[Tuple[bytes, str], ...] = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Byte ranges handed out per worker process, so that uneven ranges even out
+CHUNKS_PER_WORKER: int = 4
+
+Record = Tuple
+
+# Field values of a block of records, one list per field
+Columns = List[list]
+
+# Codec name and the number of BOM bytes to skip before the first record
+Encoding = Tuple[str, int]
+
+
+class RecordError(ValueError):
+    """
+    A record that does not match its schema.
+    """
+
+    def __init__(self, message: str, line: str, number: int) -> None:
+        super().__init__(message)
+        self.message: str = message
+        # The stripped line and its position among the non-blank lines (1-based)
+        self.line: str = line
+        self.number: int = number
+
+
+class Field:
+    """
+    A field of a record schema.
+
+    Message templates may use {line} (the stripped line), {number} (the
+    position of the line among the non-blank lines), {text} (the stripped
+    field) and {value} (the converted field).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: Callable[[str], object] = str,
+        non_empty: bool = False,
+        non_negative: bool = False,
+        keep_text: bool = False,
+        empty_message: str = "Empty {name} in line {number}: {line}",
+        invalid_message: Optional[str] = None,
+        negative_message: str = "Negative {name} not allowed: {value}"
+    ) -> None:
+        """
+        Args:
+            name (str): Field name
+            kind (Callable[[str], object]): Converter such as str, int or float
+            non_empty (bool): Whether the field must not be empty
+            non_negative (bool): Whether the converted value must not be negative
+            keep_text (bool): Whether to return the stripped text instead of the converted value
+            empty_message (str): Message template for an empty field
+            invalid_message (Optional[str]): Message template for a failed conversion;
+                None keeps the converter's own message
+            negative_message (str): Message template for a negative value
+        """
+        self.name: str = name
+        self.kind: Callable[[str], object] = kind
+        self.non_empty: bool = non_empty
+        self.non_negative: bool = non_negative
+        self.keep_text: bool = keep_text
+        self.empty_message: str = empty_message
+        self.invalid_message: Optional[str] = invalid_message
+        self.negative_message: str = negative_message
+
+
+class RecordSchema:
+    """
+    Declarative description of a delimited record.
+
+    All emptiness checks run before any conversion, in field order.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[Field],
+        delimiter: str = ",",
+        format_message: str = "Invalid line format (expected {count} fields): {line}"
+    ) -> None:
+        """
+        Args:
+            fields (Sequence[Field]): Fields in the order they appear on a line
+            delimiter (str): Field separator
+            format_message (str): Message template for a line with the wrong number of fields
+        """
+        self.fields: Tuple[Field, ...] = tuple(fields)
+        self.delimiter: str = delimiter
+        self.format_message: str = format_message
+        # Checks flattened into tuples so that parsing needs no attribute lookups per field
+        self.width: int = len(self.fields)
+        self.required: Tuple[int, ...] = tuple(
+            index for index, field in enumerate(self.fields) if field.non_empty
+        )
+        self.conversions: Tuple[Tuple[int, Callable[[str], object], bool, bool], ...] = tuple(
+            (index, field.kind, field.non_negative, field.keep_text)
+            for index, field in enumerate(self.fields) if field.kind is not str
+        )
+
+    def _error(self, template: str, line: str, number: int, index: int = -1,
+               text: str = "", value: object = None) -> RecordError:
+        message: str = template.format(
+            line=line, number=number, count=self.width,
+            name=self.fields[index].name if index >= 0 else "", text=text, value=value
+        )
+        return RecordError(message, line, number)
+
+    def parse(self, line: str, number: int) -> Record:
+        """
+        Split and validate one stripped, non-blank line.
+
+        Args:
+            line (str): Stripped line
+            number (int): Position of the line among the non-blank lines (1-based)
+
+        Returns:
+            Record: Field values in schema order
+
+        Raises:
+            RecordError: If the line does not match the schema
+        """
+        texts: List = line.split(self.delimiter)
+        if len(texts) != self.width:
+            raise self._error(self.format_message, line, number)
+
+        texts = [text.strip() for text in texts]
+        for index in self.required:
+            if not texts[index]:
+                raise self._error(self.fields[index].empty_message, line, number, index)
+
+        for index, kind, non_negative, keep_text in self.conversions:
+            text: str = texts[index]
+            try:
+                value = kind(text)
+            except ValueError as e:
+                template: Optional[str] = self.fields[index].invalid_message
+                if template is None:
+                    raise RecordError(str(e), line, number)
+                raise self._error(template, line, number, index, text)
+            if non_negative and value < 0:
+                raise self._error(self.fields[index].negative_message, line, number, index, text, value)
+            if not keep_text:
+                texts[index] = value
+
+        return tuple(texts)
+
+    def _parse_valid(self, lines: List[str]) -> Optional[Columns]:
+        """
+        Validate a block of stripped, non-blank lines a column at a time.
+
+        The lines are joined and split once, so every field is cut out in
+        C; each column is then stripped, checked and converted with map().
+        Only valid blocks are told apart: any problem makes this return None
+        and leaves the error message to parse().
+
+        Args:
+            lines (List[str]): Stripped, non-blank lines
+
+        Returns:
+            Optional[Columns]: Field values of the block, None if a line is invalid
+        """
+        width: int = self.width
+        delimiter: str = self.delimiter
+        # Each line after the first starts with a newline, so its first field can be told apart
+        fields: List[str] = (delimiter + "\n").join(lines).split(delimiter)
+        if len(fields) != len(lines) * width:
+            return None
+        columns: Columns = [fields[index::width] for index in range(width)]
+        # Fields only line up if every line start fell into the first column
+        if "".join(columns[0]).count("\n") != len(lines) - 1:
+            return None
+
+        columns = [list(map(str.strip, column)) for column in columns]
+        for index in self.required:
+            if not all(columns[index]):
+                return None
+
+        for index, kind, non_negative, keep_text in self.conversions:
+            try:
+                values: list = list(map(kind, columns[index]))
+            except ValueError:
+                return None
+            # min() only returns NaN when it comes first, and parse() then decides
+            if non_negative and not min(values) >= 0:
+                return None
+            if not keep_text:
+                columns[index] = values
+
+        return columns
+
+    def parse_block(self, lines: Iterable[str], first_number: int = 1) -> Columns:
+        """
+        Parse a block of raw lines, skipping blank ones.
+
+        Valid blocks never go through parse(); it is only called line by
+        line to report the first invalid line of a block.
+
+        Args:
+            lines (Iterable[str]): Raw lines, with or without line endings
+            first_number (int): Number of the first non-blank line
+
+        Returns:
+            Columns: Field values of the non-blank lines, one list per field;
+            zip(*columns) gives the records
+
+        Raises:
+            RecordError: At the first line that does not match the schema
+        """
+        stripped: List[str] = list(filter(None, map(str.strip, lines)))
+        if not stripped:
+            return [[] for _ in range(self.width)]
+
+        columns: Optional[Columns] = self._parse_valid(stripped)
+        if columns is None:
+            records: List[Record] = [
+                self.parse(line, number) for number, line in enumerate(stripped, first_number)
+            ]
+            columns = [list(column) for column in zip(*records)]
+        return columns
+
+
+def detect_encoding(sample: bytes) -> Encoding:
+    """
+    Detect the encoding of a file from its first bytes.
+
+    Args:
+        sample (bytes): Start of the file
+
+    Returns:
+        Encoding: Codec name and the length of the BOM to skip. The UTF-16
+        and UTF-32 codecs read their BOM themselves, so it is not skipped.
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom) if encoding == "utf-8" else 0
+
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A character cut off by the end of the sample is still UTF-8
+        if not (len(sample) == ENCODING_SAMPLE_BYTES and e.reason == "unexpected end of data"):
+            return FALLBACK_ENCODING, 0
+    return "utf-8", 0
+
+
+def is_ascii_compatible(encoding: str) -> bool:
+    """
+    Check whether an encoding stores ASCII characters as single ASCII bytes.
+
+    Files in such encodings can be split at newline bytes before decoding.
+
+    Args:
+        encoding (str): Codec name
+
+    Returns:
+        bool: True for encodings such as UTF-8 and cp1251, False for UTF-16
+    """
+    return "\r\n,;\t ".encode(encoding) == b"\r\n,;\t "
+
+
+def _split_lines(data: bytes, encoding: str) -> List[str]:
+    """
+    Decode a newline-aligned block and split it like text-mode files do.
+
+    Args:
+        data (bytes): Bytes in an ASCII-compatible encoding, ending at a line boundary
+        encoding (str): Codec name
+
+    Returns:
+        List[str]: Lines without line endings
+    """
+    text: str = data.decode(encoding)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.split("\n")
+
+
+def _read_text(path: str, schema: RecordSchema, encoding: str) -> Iterator[Columns]:
+    """
+    Read records in text mode, for encodings that cannot be split as bytes.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        encoding (str): Codec name
+
+    Yields:
+        Columns: Field values of the non-blank lines of each block
+    """
+    number: int = 1
+    with open(path, "r", encoding=encoding) as file:
+        while True:
+            with span("read"):
+                lines: List[str] = file.readlines(BLOCK_BYTES)
+            if not lines:
+                return
+            with span("parse"):
+                columns: Columns = schema.parse_block(lines, number)
+            count("records", len(columns[0]))
+            number += len(columns[0])
+            yield columns
+
+
+def read_stream(
+    path: str,
+    schema: RecordSchema,
+    encoding: Encoding = ("utf-8", 0)
+) -> Iterator[Columns]:
+    """
+    Read records from a buffered binary stream, one newline-aligned block at a time.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        encoding (Encoding): Codec name and BOM length
+
+    Yields:
+        Columns: Field values of the non-blank lines of each block
+    """
+    codec, bom_length = encoding
+    if not is_ascii_compatible(codec):
+        yield from _read_text(path, schema, codec)
+        return
+
+    number: int = 1
+    with open(path, "rb") as file:
+        file.seek(bom_length)
+        while True:
+            with span("read"):
+                data: bytes = file.read(BLOCK_BYTES)
+                if not data:
+                    return
+                if not data.endswith(b"\n"):
+                    data += file.readline()
+                lines: List[str] = _split_lines(data, codec)
+            with span("parse"):
+                columns: Columns = schema.parse_block(lines, number)
+            count("records", len(columns[0]))
+            number += len(columns[0])
+            yield columns
+
+
+def read_mmap(
+    path: str,
+    schema: RecordSchema,
+    encoding: Encoding = ("utf-8", 0)
+) -> Iterator[Columns]:
+    """
+    Read records from a memory-mapped file, decoding it in large blocks.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        encoding (Encoding): Codec name and BOM length
+
+    Yields:
+        Columns: Field values of the non-blank lines of each block
+    """
+    codec, bom_length = encoding
+    if not is_ascii_compatible(codec):
+        yield from _read_text(path, schema, codec)
+        return
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            number: int = 1
+            start: int = bom_length
+            size: int = len(view)
+            while start < size:
+                end: int = view.find(b"\n", min(start + BLOCK_BYTES, size) - 1)
+                end = size if end == -1 else end + 1
+                with span("read"):
+                    lines: List[str] = _split_lines(view[start:end], codec)
+                with span("parse"):
+                    columns: Columns = schema.parse_block(lines, number)
+                count("records", len(columns[0]))
+                number += len(columns[0])
+                yield columns
+                start = end
+
+
+def _read_range(path: str, start: int, end: int, origin: int = 0) -> bytes:
+    """
+    Read the lines that start within a byte range.
+
+    Args:
+        path (str): File path
+        start (int): First byte of the range
+        end (int): Byte after the range
+        origin (int): First byte of the first line, after any BOM
+
+    Returns:
+        bytes: Complete lines whose first byte lies in [start, end)
+    """
+    with open(path, "rb") as file:
+        if start > origin:
+            # Skip the line that started before the range, unless the range starts a line
+            file.seek(start - 1)
+            file.readline()
+        else:
+            file.seek(start)
+        first: int = file.tell()
+        if first >= end:
+            return b""
+        data: bytes = file.read(end - first)
+        if not data.endswith(b"\n"):
+            data += file.readline()
+        return data
+
+
+def _parse_range(
+    path: str,
+    schema: RecordSchema,
+    start: int,
+    end: int,
+    encoding: Encoding
+) -> Tuple[Columns, Optional[str]]:
+    """
+    Parse the lines of a byte range in a worker process.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        start (int): First byte of the range
+        end (int): Byte after the range
+        encoding (Encoding): Name of an ASCII-compatible codec and BOM length
+
+    Returns:
+        Tuple[Columns, Optional[str]]: Field values up to the first invalid
+        line, and that line (None if all lines are valid)
+    """
+    codec, bom_length = encoding
+    lines: List[str] = _split_lines(_read_range(path, start, end, bom_length), codec)
+    try:
+        return schema.parse_block(lines), None
+    except RecordError as e:
+        # Numbers are only known to the parent, which parses the invalid line again
+        valid: List[str] = [line for line in lines if line.strip()][:e.number - 1]
+        return schema.parse_block(valid), e.line
+
+
+def read_parallel(
+    path: str,
+    schema: RecordSchema,
+    encoding: Encoding = ("utf-8", 0),
+    workers: Optional[int] = None
+) -> Iterator[Columns]:
+    """
+    Read records with a pool of processes, each parsing a byte range of the file.
+
+    Blocks are yielded in file order. An invalid line is parsed again in
+    this process so that its error carries the number of the line in the
+    whole file.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        encoding (Encoding): Codec name and BOM length
+        workers (Optional[int]): Number of processes, os.cpu_count() by default
+
+    Yields:
+        Columns: Field values of the non-blank lines of each byte range
+    """
+    codec, bom_length = encoding
+    if not is_ascii_compatible(codec):
+        yield from _read_text(path, schema, codec)
+        return
+
+    size: int = os.path.getsize(path)
+    workers = workers or os.cpu_count() or 1
+    chunk_count: int = max(1, min(workers * CHUNKS_PER_WORKER, size // BLOCK_BYTES or 1))
+    bounds: List[int] = [
+        bom_length + (size - bom_length) * index // chunk_count for index in range(chunk_count + 1)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _parse_range,
+            [path] * chunk_count,
+            [schema] * chunk_count,
+            bounds[:-1],
+            bounds[1:],
+            [encoding] * chunk_count
+        )
+        number: int = 1
+        while True:
+            # Reading and parsing happen in the workers; only the wait for them is measured here
+            with span("wait"):
+                result: Optional[Tuple[Columns, Optional[str]]] = next(results, None)
+            if result is None:
+                return
+            columns, invalid_line = result
+            count("records", len(columns[0]))
+            yield columns
+            number += len(columns[0])
+            if invalid_line is not None:
+                schema.parse(invalid_line, number)
+
+
+# Backends by name; each takes (path, schema, encoding) and yields blocks of records in file order
+Reader = Callable[[str, RecordSchema, Encoding], Iterator[Columns]]
+BACKENDS: Dict[str, Reader] = {
+    "stream": read_stream,
+    "mmap": read_mmap,
+    "parallel": read_parallel,
+}
+
+
+def read_records(
+    path: str,
+    schema: RecordSchema,
+    backend: str = "stream",
+    workers: Optional[int] = None,
+    encoding: Optional[str] = None
+) -> Iterator[Record]:
+    """
+    Read and validate the records of a delimited text file.
+
+    Args:
+        path (str): File path
+        schema (RecordSchema): Record schema
+        backend (str): Name in BACKENDS
+        workers (Optional[int]): Number of processes for the parallel backend;
+            the other backends run in this process
+        encoding (Optional[str]): Codec name, None to detect it from the start of the file
+
+    Yields:
+        Record: Field values of every non-blank line, in file order
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        RecordError: At the first line that does not match the schema
+        ValueError: If the backend is unknown or the file cannot be decoded
+    """
+    try:
+        reader: Reader = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown record reader backend: {backend}")
+    if reader is read_parallel:
+        reader = partial(read_parallel, workers=workers)
+
+    with open(path, "rb") as file:
+        sample: bytes = file.read(ENCODING_SAMPLE_BYTES)
+
+    detected: Encoding = detect_encoding(sample)
+    if encoding is not None:
+        codec: str = codecs.lookup(encoding).name
+        if codec == "utf-8-sig":
+            codec = "utf-8"
+        # A BOM matching the given encoding is still skipped
+        detected = (codec, detected[1] if codec == detected[0] else 0)
+    # Tuples are made one at a time as the caller iterates, so they can be freed as soon as it moves on
+    return chain.from_iterable(zip(*columns) for columns in reader(path, schema, detected))